@@ -5,11 +5,20 @@ AI Document Processor - Simple Server
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse
 import json
+import os
 import uuid
 from datetime import datetime
 
+from response_encoding import coalesce, iter_compressed, iter_list_json, negotiate
+from static_files import StaticFiles
+
 documents = {}
 
+# Cached HTML pages: simple.html first, app.html as the fallback
+static_files = StaticFiles(os.path.dirname(os.path.abspath(__file__)),
+                           index=("simple.html", "app.html"), aliases=("/index.html", "/app.html", "/simple.html"),
+                           headers=[("Access-Control-Allow-Origin", "*")])
+
 class Handler(BaseHTTPRequestHandler):
     def do_GET(self):
         path = urlparse(self.path).path
@@ -17,20 +26,8 @@ class Handler(BaseHTTPRequestHandler):
         # Root path - serve HTML
         if path in ["/", "/index.html", "/app.html", "/simple.html"]:
             try:
-                # Try to read simple.html
-                try:
-                    with open("simple.html", "r", encoding="utf-8") as f:
-                        html = f.read()
-                except FileNotFoundError:
-                    # Fall back to app.html
-                    with open("app.html", "r", encoding="utf-8") as f:
-                        html = f.read()
-                
-                self.send_response(200)
-                self.send_header("Content-Type", "text/html; charset=utf-8")
-                self.send_header("Access-Control-Allow-Origin", "*")
-                self.end_headers()
-                self.wfile.write(html.encode("utf-8"))
+                if not static_files.serve(self, path):
+                    raise FileNotFoundError("No HTML file found")
                 return
             except Exception as e:
                 print(f"Error loading HTML: {e}")
@@ -51,13 +48,21 @@ class Handler(BaseHTTPRequestHandler):
         
         # Get all documents
         if path == "/api/documents":
+            # Serialized (and compressed) one document at a time; HTTP/1.0 ends the body at close
+            items = list(documents.values())
+            encoding = negotiate(self.headers.get("Accept-Encoding"))
+            chunks = iter_list_json(items, {"total": len(items)})
+            if encoding:
+                chunks = iter_compressed(chunks, encoding)
             self.send_response(200)
             self.send_header("Content-Type", "application/json")
             self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Vary", "Accept-Encoding")
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
             self.end_headers()
-            items = list(documents.values())
-            response = {"items": items, "total": len(items)}
-            self.wfile.write(json.dumps(response).encode())
+            for chunk in coalesce(chunks):
+                self.wfile.write(chunk)
             return
         
         # Not found
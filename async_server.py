@@ -0,0 +1,457 @@
+"""
+AI Document Processor - asyncio server engine
+Serves a BaseHTTPRequestHandler's REST surface from one event loop: sockets,
+keep-alive and request bodies are handled asynchronously, handler methods
+run on a bounded thread pool
+"""
+
+import asyncio
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http import HTTPStatus
+from http.client import parse_headers
+import io
+import socket
+import tempfile
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# Most bytes and lines a request line plus headers may take
+MAX_HEADER_BYTES = 64 * 1024
+MAX_HEADER_LINES = 100
+# Bodies up to this size stay in memory; larger ones (uploads) spill to a temp file
+SPOOL_MEMORY = 1024 * 1024
+READ_SIZE = 64 * 1024
+
+
+class BadRequest(Exception):
+    """The request can't be parsed; answered with `status` and the connection closed"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    """One parsed request: request line, raw header block, headers and spooled body"""
+
+    def __init__(self, line, header_block, headers, body):
+        self.line = line
+        self.method, _, rest = line.decode("iso-8859-1").rstrip("\r\n").partition(" ")
+        self.target, _, self.version = rest.rpartition(" ")
+        self.header_block = header_block
+        self.headers = headers
+        self.body = body
+        # The connection's StreamWriter, for hooks that answer the request themselves
+        self.writer = None
+        parts = urlsplit(self.target)
+        self.path = parts.path
+        self.query = parts.query
+
+    @property
+    def keep_alive(self):
+        connection = (self.headers.get("Connection") or "").lower()
+        if self.version == "HTTP/1.1":
+            return connection != "close"
+        return connection == "keep-alive"
+
+    def set_query(self, **updates):
+        """Rewrite query parameters before the request is handed to the handler"""
+        params = [(k, v) for k, v in parse_qsl(self.query, keep_blank_values=True) if k not in updates]
+        params.extend((k, str(v)) for k, v in updates.items() if v is not None)
+        self.query = urlencode(params)
+        self.target = self.path + ("?" + self.query if self.query else "")
+        self.line = f"{self.method} {self.target} {self.version}\r\n".encode("iso-8859-1")
+
+
+class ResponseWriter:
+    """wfile for a handler running on a worker thread
+
+    Each write is handed to the event loop and waits until the transport
+    has drained, so a large or streamed response applies backpressure to
+    the handler instead of piling up in memory. `count` is the number of
+    bytes written (what metrics.CountingWriter provides on the threaded
+    servers). Once the request has timed out, writes raise BrokenPipeError.
+    """
+
+    def __init__(self, loop, writer, timeout):
+        self.loop = loop
+        self.writer = writer
+        self.timeout = timeout
+        self.count = 0
+        self.abandoned = False
+
+    def write(self, data):
+        if self.abandoned:
+            raise BrokenPipeError("Request timed out")
+        data = bytes(data)
+        try:
+            asyncio.run_coroutine_threadsafe(self._write(data), self.loop).result(self.timeout)
+        except (concurrent.futures.TimeoutError, RuntimeError):
+            # A client that stopped reading, or the loop shutting down
+            raise BrokenPipeError("Could not write the response")
+        self.count += len(data)
+        return len(data)
+
+    async def _write(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def flush(self):
+        pass
+
+
+class _SendfileShim:
+    """Stands in for handler.connection: sendfile() copies the file through wfile"""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def sendfile(self, file, offset=0, count=None):
+        file.seek(offset)
+        sent = 0
+        while count is None or sent < count:
+            data = file.read(READ_SIZE if count is None else min(READ_SIZE, count - sent))
+            if not data:
+                break
+            self.wfile.write(data)
+            sent += len(data)
+        # The threaded servers bypass wfile here; static_files adds the count itself
+        self.wfile.count -= sent
+        return sent
+
+
+class AsyncHTTPServer:
+    """An asyncio HTTP/1.1 server running `handler_class`'s do_* methods
+
+    The event loop owns every connection: it reads request lines, headers
+    and bodies without blocking (bodies are spooled, to disk past
+    SPOOL_MEMORY), keeps idle connections open for `idle_timeout` seconds
+    and refuses connections beyond `max_connections`. Each complete
+    request then runs on a pool of `workers` threads through a
+    handler_class instance whose rfile is the spooled body; at most
+    `max_pending` requests wait for a worker, and a request that takes
+    longer than `request_timeout` to start its response is answered 503.
+    A response that has started may take longer, as long as each write
+    drains within `request_timeout`.
+
+    `hooks` maps route patterns (resolved through `router`) to coroutines
+    hook(server, request, params) that run on the loop first. A hook
+    returns True when it has answered the request itself, as a stream
+    does, or None to pass the (possibly rewritten) request on to the
+    handler, e.g. after waiting for a long-poll condition without holding
+    a thread. Hooks wait on changed(), which notify() (callable from any
+    thread) wakes.
+
+    The interface matches socketserver's: serve_forever(), shutdown(),
+    server_close() and server_address. With `reuse_port`, the socket is
+    bound with SO_REUSEPORT so other processes can listen on the same port.
+    """
+
+    def __init__(self, server_address, handler_class, workers=32, max_pending=None, max_connections=10000,
+                 request_timeout=30.0, idle_timeout=75.0, max_body=None, backlog=1024, router=None, hooks=None,
+                 sock=None, reuse_port=False):
+        self.handler_class = type(f"Async{handler_class.__name__}", (handler_class,), {
+            # The engine answers Expect: 100-continue itself, before reading the body
+            "handle_expect_100": lambda self: True,
+        })
+        self.workers = workers
+        self.max_connections = max_connections
+        self.request_timeout = request_timeout
+        self.idle_timeout = idle_timeout
+        self.max_body = max_body
+        self.router = router
+        self.hooks = dict(hooks or {})
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="async-handler")
+        self.max_pending = max_pending or workers * 4
+        self.connections = 0
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(server_address)
+            sock.listen(backlog)
+        self.socket = sock
+        self.server_address = sock.getsockname()[:2]
+        self._loop = None
+        self._stopping = None
+        self._stopped = threading.Event()
+        self._slots = None
+        self._changed = None
+        self._wake_pending = False
+
+    # Serving
+
+    def serve_forever(self):
+        self._stopped.clear()
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self._stopped.set()
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.workers + self.max_pending)
+        self._changed = asyncio.Event()
+        server = await asyncio.start_server(self._connection, sock=self.socket, limit=MAX_HEADER_BYTES)
+        async with server:
+            await self._stopping.wait()
+        self._loop = None
+
+    def shutdown(self):
+        """Stop serve_forever() (from another thread) and wait for it to return"""
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._stopping.set)
+            self._stopped.wait()
+
+    def server_close(self):
+        self.socket.close()
+        self.executor.shutdown(wait=False)
+
+    # Change notification for hooks
+
+    def notify(self):
+        """Wake every hook waiting in changed(); safe to call from any thread, often"""
+        loop = self._loop
+        if loop is None or self._wake_pending:
+            return
+        self._wake_pending = True
+        try:
+            loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:  # the loop has just closed
+            pass
+
+    def _wake(self):
+        self._wake_pending = False
+        event, self._changed = self._changed, asyncio.Event()
+        event.set()
+
+    async def changed(self, timeout):
+        """Wait until the next notify() or `timeout` seconds; True if notified"""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    # Connections
+
+    async def _connection(self, reader, writer):
+        if self.connections >= self.max_connections:
+            await self.send_error(writer, HTTPStatus.SERVICE_UNAVAILABLE, "Too many connections")
+            return
+        self.connections += 1
+        sock = writer.get_extra_info("socket")
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            # asyncio only does this for sockets created with proto=IPPROTO_TCP;
+            # without it a response's headers and body meet delayed ACKs
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while not self._stopping.is_set():
+                try:
+                    line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except (asyncio.TimeoutError, ConnectionError, asyncio.LimitOverrunError, ValueError):
+                    break
+                if not line:
+                    break
+                if line in (b"\r\n", b"\n"):
+                    continue
+                try:
+                    request = await asyncio.wait_for(self._read_request(line, reader, writer), self.request_timeout)
+                except BadRequest as e:
+                    await self.send_error(writer, e.status, str(e))
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                try:
+                    keep_alive = await self._respond(request, writer)
+                finally:
+                    request.body.close()
+                if not keep_alive:
+                    break
+        finally:
+            self.connections -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def _read_request(self, line, reader, writer):
+        if not line.endswith(b"\n"):
+            raise BadRequest(HTTPStatus.REQUEST_URI_TOO_LONG, "Request line too long")
+        lines = []
+        size = len(line)
+        while True:
+            try:
+                header = await reader.readline()
+            except (asyncio.LimitOverrunError, ValueError):
+                raise BadRequest(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Header line too long")
+            if not header:
+                raise asyncio.IncompleteReadError(b"", None)
+            lines.append(header)
+            size += len(header)
+            if header in (b"\r\n", b"\n"):
+                break
+            if size > MAX_HEADER_BYTES or len(lines) > MAX_HEADER_LINES:
+                raise BadRequest(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Request headers too large")
+        header_block = b"".join(lines)
+        headers = parse_headers(io.BytesIO(header_block))
+        request = Request(line, header_block, headers, None)
+        request.body = await self._read_body(request, reader, writer)
+        return request
+
+    async def _read_body(self, request, reader, writer):
+        headers = request.headers
+        chunked = "chunked" in (headers.get("Transfer-Encoding") or "").lower()
+        try:
+            length = int(headers.get("Content-Length") or 0)
+        except ValueError:
+            raise BadRequest(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if length < 0:
+            raise BadRequest(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        if not chunked and self.max_body is not None and length > self.max_body:
+            raise BadRequest(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+        if (chunked or length) and (headers.get("Expect") or "").lower() == "100-continue" and request.version == "HTTP/1.1":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await writer.drain()
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY)
+        if chunked:
+            length = await self._read_chunked(reader, body)
+            # The handler sees a plain Content-Length body
+            kept = [line for line in request.header_block.splitlines(keepends=True)
+                    if not line.lower().startswith((b"transfer-encoding:", b"content-length:")) and line.strip()]
+            request.header_block = b"".join(kept) + b"Content-Length: %d\r\n\r\n" % length
+            request.headers = parse_headers(io.BytesIO(request.header_block))
+        else:
+            remaining = length
+            while remaining:
+                data = await reader.read(min(READ_SIZE, remaining))
+                if not data:
+                    raise asyncio.IncompleteReadError(b"", remaining)
+                body.write(data)
+                remaining -= len(data)
+        body.seek(0)
+        return body
+
+    async def _read_chunked(self, reader, body):
+        total = 0
+        while True:
+            line = await reader.readline()
+            try:
+                size = int(line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise BadRequest(HTTPStatus.BAD_REQUEST, "Malformed chunked body")
+            if size == 0:
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return total
+            total += size
+            if self.max_body is not None and total > self.max_body:
+                raise BadRequest(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+            while size:
+                data = await reader.read(min(READ_SIZE, size))
+                if not data:
+                    raise asyncio.IncompleteReadError(b"", size)
+                body.write(data)
+                size -= len(data)
+            await reader.readline()
+
+    # Responses
+
+    async def _respond(self, request, writer):
+        """Answer one request; returns whether the connection stays open"""
+        request.writer = writer
+        if self.router is not None and self.hooks:
+            route, params, _ = self.router.resolve(request.method, request.path)
+            hook = self.hooks.get(route.pattern) if route is not None else None
+            if hook is not None and await hook(self, request, params):
+                # A hook that answered with send_error() has closed the connection
+                return request.keep_alive and not writer.is_closing()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.request_timeout)
+        except asyncio.TimeoutError:
+            await self.send_error(writer, HTTPStatus.SERVICE_UNAVAILABLE, "Server busy", {"Retry-After": "1"})
+            return False
+        wfile = ResponseWriter(self._loop, writer, self.request_timeout)
+        future = self._loop.run_in_executor(self.executor, self._handle, request, wfile)
+        # The slot is held until the handler really finishes, even after a timeout
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            close = await asyncio.wait_for(asyncio.shield(future), self.request_timeout)
+        except asyncio.TimeoutError:
+            if wfile.count == 0:
+                wfile.abandoned = True
+                await self.send_error(writer, HTTPStatus.SERVICE_UNAVAILABLE, "Request timed out")
+                return False
+            # A response that has started, like an export, runs on for as long
+            # as the client keeps reading it; each write has its own timeout
+            try:
+                close = await future
+            except (ConnectionError, OSError):
+                return False
+        except (ConnectionError, OSError):
+            return False
+        return not close
+
+    def _handle(self, request, wfile):
+        """Run the handler for one request on a worker thread; returns whether to close the connection"""
+        handler = self.handler_class.__new__(self.handler_class)
+        handler.server = self
+        handler.client_address = self._peer(wfile.writer)
+        handler.request = None
+        handler.connection = _SendfileShim(wfile)
+        handler.wfile = wfile
+        handler.rfile = io.BytesIO(request.header_block)
+        handler.raw_requestline = request.line
+        handler.close_connection = True
+        handler.requestline = ""
+        handler.request_version = handler.default_request_version
+        handler.command = None
+        if not handler.parse_request():
+            return True
+        handler.rfile = request.body
+        method = getattr(handler, "do_" + handler.command, None)
+        if method is None:
+            handler.send_error(HTTPStatus.NOT_IMPLEMENTED, f"Unsupported method ({handler.command!r})")
+        else:
+            method()
+        return handler.close_connection
+
+    @staticmethod
+    def _peer(writer):
+        peer = writer.get_extra_info("peername")
+        return tuple(peer[:2]) if peer else ("", 0)
+
+    async def send_error(self, writer, status, message, headers=None):
+        """Answer with a small JSON error and close the connection, e.g. from a hook"""
+        status = HTTPStatus(status)
+        body = ('{"error": "%s"}' % message).encode()
+        head = [f"HTTP/1.1 {status.value} {status.phrase}", f"Date: {formatdate(usegmt=True)}",
+                "Content-Type: application/json", f"Content-Length: {len(body)}", "Connection: close"]
+        head.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        try:
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        writer.close()
+
+    async def send_stream_head(self, writer, status, headers):
+        """Start a chunked response from a hook"""
+        status = HTTPStatus(status)
+        head = [f"HTTP/1.1 {status.value} {status.phrase}", f"Date: {formatdate(usegmt=True)}",
+                "Transfer-Encoding: chunked"]
+        head.extend(f"{name}: {value}" for name, value in headers)
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+    @staticmethod
+    async def send_chunk(writer, data):
+        """Write one chunk of a chunked response; an empty chunk ends it"""
+        writer.write(b"%x\r\n%s\r\n" % (len(data), data) if data else b"0\r\n\r\n")
+        await writer.drain()
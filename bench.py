@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+"""
+AI Document Processor - Load and micro benchmarks
+Drives an in-process API server with a mix of requests, and times the
+store's list/search paths and JSON encoding; results can be saved as JSON
+and compared against an earlier run
+"""
+
+import argparse
+from datetime import date, datetime, timedelta
+import http.client
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+from pipeline import classify_batch, extract_batch, validate_batch
+import projection
+from response_encoding import coalesce, encode_response, iter_list_json
+import server
+
+TYPE_IDS = ("invoice", "receipt", "contract")
+VENDORS = ("acme", "globex", "initech", "umbrella", "stark", "wayne", "hooli", "wonka", "soylent", "tyrell")
+FILLER = ("payment", "terms", "delivery", "services", "quarterly", "consulting", "hardware", "license", "renewal", "office")
+OPERATIONS = ("upload", "list", "search", "approve", "reprocess")
+DEFAULT_MIX = "upload=1,list=4,search=3,approve=1,reprocess=1"
+
+
+# Synthetic corpus
+
+def _field_value(field, vendor, rng):
+    field_type = field.get("type")
+    if field_type == "date":
+        return (date(2025, 1, 1) + timedelta(days=rng.randrange(365))).isoformat()
+    if field_type in ("currency", "number"):
+        return f"{rng.randint(100, 50000)}.{rng.randint(0, 99):02d}"
+    if field_type == "email":
+        return f"billing@{vendor}.example"
+    return f"{vendor.title()} {rng.choice(FILLER)} {field.get('label') or field['id']}"
+
+
+def make_ocr_text(document_type, vendor, rng):
+    """OCR text with a "Label: value" line per template field and some filler"""
+    lines = [f"{field.get('label') or field['id']}: {_field_value(field, vendor, rng)}"
+             for field in document_type["extractionTemplate"]["fields"]]
+    lines.append(" ".join(rng.choice(FILLER) for _ in range(12)))
+    return "\n".join(lines)
+
+
+def seed_documents(count, seed=1234):
+    """Store `count` processed documents spread over the three document types
+
+    The pipeline's stage functions are called directly, a whole type at a
+    time, so seeding doesn't wait on the worker queues.
+    """
+    rng = random.Random(seed)
+    random.seed(seed)
+    types = {type_id: server.get_document_type(type_id) for type_id in TYPE_IDS}
+    started = datetime.now() - timedelta(minutes=count)
+    docs = []
+    for i in range(count):
+        document_type = types[TYPE_IDS[i % len(TYPE_IDS)]]
+        vendor = rng.choice(VENDORS)
+        doc = server.create_document(document_type, f"{document_type['id']}-{vendor}-{i:06d}.pdf")
+        doc["uploadedAt"] = (started + timedelta(minutes=i)).isoformat()
+        doc["ocrText"] = make_ocr_text(document_type, vendor, rng)
+        docs.append(doc)
+    for type_id, document_type in types.items():
+        batch = [doc for doc in docs if doc["documentTypeId"] == type_id]
+        inputs = [(doc["ocrText"], document_type) for doc in batch]
+        extracted = extract_batch(inputs)
+        classified = classify_batch(inputs)
+        errors = validate_batch([(data, document_type) for data, _ in extracted])
+        for doc, (data, confidence), classification, doc_errors in zip(batch, extracted, classified, errors):
+            doc["extractedData"] = data
+            doc["confidence"] = confidence
+            doc["metadata"]["classification"] = classification
+            doc["processingErrors"] = doc_errors
+            doc["status"] = "failed" if rng.random() < 0.05 else ("needs-review" if doc_errors else "completed")
+            doc["reviewStatus"] = rng.choices(("pending", "approved", "rejected"), (6, 3, 1))[0]
+    server.documents.put_many(docs)
+    return [doc["id"] for doc in docs]
+
+
+# Load test
+
+def parse_mix(value):
+    """Parse "upload=1,list=4" into {"upload": 1, "list": 4}"""
+    mix = {}
+    for part in value.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"unknown operation '{name}' (expected one of {', '.join(OPERATIONS)})")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise ValueError(f"'{part.strip()}' is not operation=weight")
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("the mix needs at least one operation with a positive weight")
+    return mix
+
+
+def _request_for(operation, ids, rng):
+    """(method, path, JSON body or None) for one request of the given kind"""
+    if operation == "upload":
+        type_id = rng.choice(TYPE_IDS)
+        return "POST", "/api/documents/upload", {"documentTypeId": type_id, "fileName": f"{type_id}-{rng.choice(VENDORS)}.pdf"}
+    if operation == "list":
+        params = {"pageSize": 20}
+        if rng.random() < 0.7:
+            params["status"] = rng.choice(("completed", "needs-review", "failed"))
+        if rng.random() < 0.5:
+            params["documentTypeId"] = rng.choice(TYPE_IDS)
+        if rng.random() < 0.3:
+            params["reviewStatus"] = rng.choice(("pending", "approved"))
+        if rng.random() < 0.5:
+            params["cursor"] = ""
+        else:
+            params["page"] = rng.randint(1, 5)
+        return "GET", "/api/documents?" + urlencode(params), None
+    if operation == "search":
+        q = rng.choice(VENDORS)
+        if rng.random() < 0.3:
+            q = q[:3]
+        elif rng.random() < 0.4:
+            q += " " + rng.choice(FILLER)
+        params = {"q": q, "pageSize": 20}
+        if rng.random() < 0.3:
+            params["documentTypeId"] = rng.choice(TYPE_IDS)
+        return "GET", "/api/documents/search?" + urlencode(params), None
+    if operation == "approve":
+        return "POST", f"/api/documents/{rng.choice(ids)}/approve", {"comments": "Checked"}
+    return "POST", f"/api/documents/{rng.choice(ids)}/reprocess", {}
+
+
+def check_cursor_paging(port):
+    """Fail fast if an empty cursor= doesn't start cursor pagination, as the list mix assumes"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        connection.request("GET", "/api/documents?cursor=&pageSize=1")
+        response = connection.getresponse()
+        body = json.loads(response.read())
+    finally:
+        connection.close()
+    if response.status != 200 or not body.get("nextCursor"):
+        raise RuntimeError(f"cursor= did not return a nextCursor (HTTP {response.status})")
+
+
+class _Client(threading.Thread):
+    """Sends requests over one keep-alive connection until told to stop"""
+
+    def __init__(self, port, mix, ids, seed, stop, record):
+        super().__init__(daemon=True)
+        self.port = port
+        self.operations = list(mix)
+        self.weights = [mix[name] for name in self.operations]
+        self.ids = ids
+        self.rng = random.Random(seed)
+        self.stop = stop
+        self.record = record
+        # operation -> [latency in seconds]; operation -> {status: count}
+        self.latencies = {name: [] for name in self.operations}
+        self.statuses = {name: {} for name in self.operations}
+
+    def run(self):
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+        while not self.stop.is_set():
+            operation = self.rng.choices(self.operations, self.weights)[0]
+            method, path, payload = _request_for(operation, self.ids, self.rng)
+            body = json.dumps(payload).encode() if payload is not None else None
+            headers = {"Content-Type": "application/json", "Accept-Encoding": "gzip"} if body is not None else {"Accept-Encoding": "gzip"}
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+                status = "error"
+            elapsed = time.perf_counter() - started
+            if self.record.is_set():
+                self.latencies[operation].append(elapsed)
+                self.statuses[operation][status] = self.statuses[operation].get(status, 0) + 1
+        connection.close()
+
+
+def rss_mib():
+    """Resident set size of this process, in MiB"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies, statuses, elapsed):
+    values = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if status == "error" or status >= 500)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "statuses": {str(status): count for status, count in sorted(statuses.items(), key=lambda item: str(item[0]))},
+        "throughput": len(values) / elapsed if elapsed else 0.0,
+        "meanMs": 1000 * sum(values) / len(values) if values else 0.0,
+        "p50Ms": 1000 * percentile(values, 50),
+        "p95Ms": 1000 * percentile(values, 95),
+        "p99Ms": 1000 * percentile(values, 99),
+        "maxMs": 1000 * values[-1] if values else 0.0,
+    }
+
+
+def run_load(args):
+    mix = parse_mix(args.mix)
+    server.configure_access_log("off")
+    server.configure_store("memory")
+    server.configure_processing(args.processing_workers)
+    # Every client shares one address; measure capacity, not the per-client limits
+    server.configure_limits({"api": 0, "processing": 0}, queue_high=0, max_latency=0)
+    rss_before_seed = rss_mib()
+    ids = seed_documents(args.docs, args.seed)
+    rss_seeded = rss_mib()
+
+    httpd = server.make_server("127.0.0.1", 0, mode=args.mode, workers=args.workers, backlog=max(128, args.concurrency))
+    port = httpd.server_address[1]
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    check_cursor_paging(port)
+
+    stop = threading.Event()
+    record = threading.Event()
+    clients = [_Client(port, mix, ids, args.seed + i, stop, record) for i in range(args.concurrency)]
+    for client in clients:
+        client.start()
+    time.sleep(args.warmup)
+    record.set()
+    started = time.perf_counter()
+    peak_rss = rss_mib()
+    while time.perf_counter() - started < args.duration:
+        time.sleep(min(0.25, args.duration))
+        peak_rss = max(peak_rss, rss_mib())
+    elapsed = time.perf_counter() - started
+    record.clear()
+    stop.set()
+    for client in clients:
+        client.join()
+    httpd.shutdown()
+    httpd.server_close()
+
+    operations = {}
+    all_latencies = []
+    all_statuses = {}
+    for name in mix:
+        latencies = [value for client in clients for value in client.latencies.get(name, ())]
+        statuses = {}
+        for client in clients:
+            for status, count in client.statuses.get(name, {}).items():
+                statuses[status] = statuses.get(status, 0) + count
+                all_statuses[status] = all_statuses.get(status, 0) + count
+        all_latencies.extend(latencies)
+        operations[name] = summarize(latencies, statuses, elapsed)
+    return {
+        "benchmark": "load",
+        "config": {
+            "docs": args.docs, "duration": args.duration, "warmup": args.warmup, "concurrency": args.concurrency,
+            "mix": mix, "mode": args.mode, "workers": args.workers,
+            "processingWorkers": args.processing_workers, "seed": args.seed,
+        },
+        "environment": _environment(),
+        "overall": summarize(all_latencies, all_statuses, elapsed),
+        "operations": operations,
+        "rssMiB": {"beforeSeed": rss_before_seed, "seeded": rss_seeded, "peak": peak_rss, "end": rss_mib()},
+    }
+
+
+# Micro-benchmarks
+
+def time_call(fn, repeat=5, min_time=0.05):
+    """Time fn() like timeit: calls per round chosen so a round takes min_time; returns seconds per call per round"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed * 10 >= min_time else 10
+    rounds = [elapsed / number]
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - started) / number)
+    return sorted(rounds)
+
+
+def micro_benchmarks(store):
+    """name -> zero-argument callable exercising one hot path"""
+    summary = projection.from_query({}, "summary")
+    page, _ = store.query({"status": "completed"}, 0, 20)
+    page_payload = {"items": summary.apply_all(page), "total": len(store), "page": 1, "pageSize": 20}
+    many, _ = store.query({}, 0, 1000)
+    many_items = summary.apply_all(many)
+    document = page[0]
+    deep_offset = max(0, min(1000, len(store) // 4))
+    return {
+        "list.all": lambda: store.query({}, 0, 20),
+        "list.status": lambda: store.query({"status": "completed"}, 0, 20),
+        "list.status_type": lambda: store.query({"status": "completed", "documentTypeId": "invoice"}, 0, 20),
+        "list.three_filters": lambda: store.query({"status": "completed", "documentTypeId": "receipt", "reviewStatus": "pending"}, 0, 20),
+        "list.deep_offset": lambda: store.query({"reviewStatus": "pending"}, deep_offset, 20),
+        "list.cursor": lambda: store.page_after({"documentTypeId": "contract"}, None, 20),
+        "list.cursor_desc_total": lambda: store.page_after({"status": "completed"}, None, 20, descending=True, with_total=True),
+        "search.word": lambda: store.search("acme", None, 0, 20),
+        "search.prefix": lambda: store.search("glo", None, 0, 20),
+        "search.two_words": lambda: store.search("initech consulting", None, 0, 20),
+        "search.filtered": lambda: store.search("wayne", {"status": "completed", "documentTypeId": "invoice"}, 0, 20),
+        "json.document": lambda: encode_response(document.to_dict()),
+        "json.page_20": lambda: encode_response(page_payload),
+        "json.page_20_gzip": lambda: encode_response(page_payload, "gzip"),
+        "json.stream_1000": lambda: b"".join(coalesce(iter_list_json(many_items, {"total": len(store)}))),
+        "json.project_summary_20": lambda: summary.apply_all(page),
+    }
+
+
+def run_micro(args):
+    server.configure_store("memory")
+    seed_documents(args.docs, args.seed)
+    results = {}
+    for name, fn in micro_benchmarks(server.documents).items():
+        if args.filter and args.filter not in name:
+            continue
+        rounds = time_call(fn, args.repeat)
+        results[name] = {
+            "bestUs": rounds[0] * 1e6,
+            "medianUs": rounds[len(rounds) // 2] * 1e6,
+            "opsPerSec": 1 / rounds[len(rounds) // 2],
+        }
+    return {
+        "benchmark": "micro",
+        "config": {"docs": args.docs, "repeat": args.repeat, "seed": args.seed},
+        "environment": _environment(),
+        "results": results,
+        "rssMiB": {"end": rss_mib()},
+    }
+
+
+# Reporting
+
+def _environment():
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def print_report(result):
+    if result["benchmark"] == "load":
+        config = result["config"]
+        print(f"load: {config['docs']} documents, {config['concurrency']} clients, {config['duration']}s, "
+              f"server mode {config['mode']}")
+        print(f"{'operation':<12}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        rows = list(result["operations"].items()) + [("overall", result["overall"])]
+        for name, stats in rows:
+            print(f"{name:<12}{stats['requests']:>10}{stats['errors']:>8}{stats['throughput']:>10.1f}"
+                  f"{stats['p50Ms']:>10.2f}{stats['p95Ms']:>10.2f}{stats['p99Ms']:>10.2f}{stats['maxMs']:>10.2f}")
+        rss = result["rssMiB"]
+        print(f"RSS: {rss['beforeSeed']:.1f} MiB before seeding, {rss['seeded']:.1f} seeded, "
+              f"{rss['peak']:.1f} peak, {rss['end']:.1f} at the end (client threads included)")
+    else:
+        print(f"micro: {result['config']['docs']} documents")
+        print(f"{'benchmark':<28}{'best us':>12}{'median us':>12}{'ops/s':>12}")
+        for name, stats in result["results"].items():
+            print(f"{name:<28}{stats['bestUs']:>12.1f}{stats['medianUs']:>12.1f}{stats['opsPerSec']:>12.0f}")
+
+
+def comparable_metrics(result):
+    """{metric name: (value, higher is better)} for the numbers compared between runs"""
+    metrics = {}
+    if result["benchmark"] == "load":
+        rows = dict(result["operations"], overall=result["overall"])
+        for name, stats in rows.items():
+            metrics[f"{name}.throughput"] = (stats["throughput"], True)
+            for key in ("p50Ms", "p95Ms", "p99Ms"):
+                metrics[f"{name}.{key}"] = (stats[key], False)
+        metrics["rss.peakMiB"] = (result["rssMiB"]["peak"], False)
+    else:
+        for name, stats in result["results"].items():
+            metrics[f"{name}.medianUs"] = (stats["medianUs"], False)
+    return metrics
+
+
+def compare(result, baseline, threshold=None):
+    """Print the change against a baseline run; returns the metrics that regressed past threshold (%)"""
+    if baseline.get("benchmark") != result["benchmark"]:
+        raise ValueError(f"Baseline is a {baseline.get('benchmark')} run, not {result['benchmark']}")
+    if baseline.get("config") != result["config"]:
+        print("note: the baseline was run with a different configuration", file=sys.stderr)
+    current = comparable_metrics(result)
+    previous = comparable_metrics(baseline)
+    regressions = []
+    print(f"\n{'metric':<34}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, (value, higher_is_better) in current.items():
+        if name not in previous:
+            continue
+        old = previous[name][0]
+        change = (value - old) / old * 100 if old else 0.0
+        worse = -change if higher_is_better else change
+        flag = ""
+        if threshold is not None and worse > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<34}{old:>12.2f}{value:>12.2f}{change:>+9.1f}%{flag}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the AI Document Processor API server")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    load = subparsers.add_parser("load", help="mixed request traffic against an in-process server")
+    load.add_argument("--docs", type=int, default=5000, help="documents seeded before the run (default: 5000)")
+    load.add_argument("--duration", type=float, default=15, help="measured seconds (default: 15)")
+    load.add_argument("--warmup", type=float, default=2, help="unmeasured seconds before that (default: 2)")
+    load.add_argument("--concurrency", type=int, default=16, help="client connections (default: 16)")
+    load.add_argument("--mix", default=DEFAULT_MIX, help=f"relative weight of each operation (default: {DEFAULT_MIX})")
+    load.add_argument("--mode", choices=["threaded", "pool", "single", "asyncio"], default="threaded", help="server concurrency mode")
+    load.add_argument("--workers", type=int, default=16, help="worker threads in pool and asyncio modes")
+    load.add_argument("--processing-workers", type=int, default=16, help="documents in the processing pipeline at once")
+
+    micro = subparsers.add_parser("micro", help="time list, search and JSON encoding directly")
+    micro.add_argument("--docs", type=int, default=20000, help="documents in the store (default: 20000)")
+    micro.add_argument("--repeat", type=int, default=5, help="timing rounds per benchmark (default: 5)")
+    micro.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+
+    for sub in (load, micro):
+        sub.add_argument("--seed", type=int, default=1234, help="random seed for the corpus and the request mix")
+        sub.add_argument("--output", help="write the results as JSON to this file")
+        sub.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+        sub.add_argument("--threshold", type=float,
+                         help="with --baseline, exit with status 1 if any metric got worse by more than this many percent")
+    args = parser.parse_args(argv)
+    if args.benchmark == "load":
+        try:
+            parse_mix(args.mix)
+        except ValueError as e:
+            parser.error(f"--mix: {e}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = run_load(args) if args.benchmark == "load" else run_micro(args)
+    print_report(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+            f.write("\n")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(result, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
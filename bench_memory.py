@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+AI Document Processor - Memory benchmark for the document store
+Compares plain nested dicts against DocumentRecords at a given corpus size
+"""
+
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from document_store import DocumentStore
+from records import DocumentRecord, TextStore
+import server
+
+
+def make_documents(count, ocr_repeat):
+    """JSON for documents shaped like real uploads, about two thirds of them processed
+
+    Each measurement decodes its own copy, so strings aren't shared between
+    the layouts being compared.
+    """
+    random.seed(1234)
+    types = [server.get_document_type(t) for t in ("invoice", "receipt", "contract")]
+    docs = []
+    for i in range(count):
+        doc_type = types[i % len(types)]
+        doc = server.create_document(doc_type, f"scan-{i:06d}.pdf")
+        doc["ocrText"] = " ".join([doc["ocrText"]] * ocr_repeat)
+        if i % 3:
+            doc.update(server.process_document(doc_type["id"], doc["ocrText"]))
+        docs.append(json.dumps(doc))
+    return docs
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure document store memory use")
+    parser.add_argument("--count", type=int, default=20000, help="Number of documents (default: 20000)")
+    parser.add_argument("--ocr-repeat", type=int, default=20,
+                        help="Repeat each sample OCR text this many times (default: 20, about 700 bytes)")
+    args = parser.parse_args()
+
+    docs = make_documents(args.count, args.ocr_repeat)
+
+    _, dict_bytes, dict_time = measure(lambda: _load_dicts(docs))
+    _, record_bytes, record_time = measure(lambda: _load_records(docs))
+    store, store_bytes, store_time = measure(lambda: _load_store(docs))
+
+    print(f"documents:            {args.count}")
+    print(f"plain dicts:          {dict_bytes / args.count:8.0f} B/doc  ({dict_bytes / 2**20:.1f} MiB, {dict_time:.2f}s)")
+    print(f"records:              {record_bytes / args.count:8.0f} B/doc  ({record_bytes / 2**20:.1f} MiB, {record_time:.2f}s)")
+    print(f"store incl. indexes:  {store_bytes / args.count:8.0f} B/doc  ({store_bytes / 2**20:.1f} MiB, {store_time:.2f}s)")
+    print(f"OCR blobs:            {len(store.texts)} ({store.texts.compressed_size() / 2**20:.1f} MiB compressed)")
+
+    start = time.perf_counter()
+    body = json.dumps([doc.to_dict() for doc in store.values()])
+    print(f"serialize all:        {time.perf_counter() - start:.2f}s ({len(body) / 2**20:.1f} MiB JSON)")
+
+
+def _load_dicts(docs):
+    return {doc["id"]: doc for doc in map(json.loads, docs)}
+
+
+def _load_records(docs):
+    texts = TextStore()
+    records = {}
+    for doc in map(json.loads, docs):
+        record = records[doc["id"]] = DocumentRecord.from_dict(doc, texts)
+        texts.incref(record.ocr_key)
+    return records, texts
+
+
+def _load_store(docs):
+    store = DocumentStore()
+    store.put_many([json.loads(doc) for doc in docs])
+    return store
+
+
+if __name__ == "__main__":
+    main()
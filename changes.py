@@ -0,0 +1,144 @@
+"""
+AI Document Processor - Document change feed
+Sequence-numbered diffs of every document write, for long-poll and
+server-sent event subscribers
+"""
+
+from collections import deque
+from contextlib import contextmanager
+import threading
+import time
+
+from projection import INTERNAL_FIELDS, SUMMARY_FIELDS
+from response_encoding import dumps
+
+# Left out of diffs: ocrText because of its size (clients fetch the document
+# for it), the internal fields because clients never see them
+UNTRACKED_FIELDS = ("ocrText",) + INTERNAL_FIELDS
+
+
+class ChangeFeed:
+    """The most recent document changes, numbered in the order they were applied
+
+    Each event is {"seq", "id", "op", "fields"}: op is "put" (a new or
+    replaced document; fields are its summary fields), "update" (fields
+    holds just the fields whose value changed) or "delete". record() is a
+    DocumentStore listener and runs under the store's lock, so sequence
+    numbers follow the order writes were applied in.
+
+    Sequence numbers start from the startup time in microseconds, so they
+    keep increasing across restarts. A subscriber resuming from a number
+    the feed no longer holds (too old, or from an earlier run) is told to
+    reset: refetch what it shows, then follow the feed from `latest`.
+
+    With several server processes, each numbers its feed from its own
+    `start` in steps of the process count, so no two processes hand out
+    the same number and a subscriber resuming on another process is told
+    to reset instead of silently skipping events.
+    """
+
+    def __init__(self, capacity=10000, start=None, step=1):
+        self.capacity = capacity
+        self.step = step
+        self._events = deque(maxlen=capacity)
+        self._seq = start if start is not None else time.time_ns() // 1000
+        self._changed = threading.Condition()
+        self._watchers = []
+        self.subscribers = 0
+
+    @property
+    def latest(self):
+        return self._seq
+
+    def add_watcher(self, callback):
+        """Call callback() after every new event, e.g. to wake waiters that can't block on the condition"""
+        self._watchers.append(callback)
+
+    @contextmanager
+    def subscription(self):
+        """Count an open stream in `subscribers` while the block runs"""
+        with self._changed:
+            self.subscribers += 1
+        try:
+            yield self
+        finally:
+            with self._changed:
+                self.subscribers -= 1
+
+    def record(self, op, old, new, changed=None):
+        """Store listener: add the event for one write, if it changed anything visible"""
+        if op == "delete":
+            event = {"seq": None, "id": old.id, "op": "delete", "fields": {}}
+        elif op == "put" or old is None:
+            fields = {key: new[key] for key in SUMMARY_FIELDS if key != "id" and key in new}
+            event = {"seq": None, "id": new.id, "op": "put", "fields": fields}
+        else:
+            fields = {}
+            for key in changed if changed is not None else new:
+                if key in UNTRACKED_FIELDS or key == "id":
+                    continue
+                value = new.get(key)
+                if value != old.get(key):
+                    fields[key] = value
+            if not fields:
+                return None
+            event = {"seq": None, "id": new.id, "op": "update", "fields": fields}
+        with self._changed:
+            self._seq += self.step
+            event["seq"] = self._seq
+            self._events.append(event)
+            self._changed.notify_all()
+        for watcher in self._watchers:
+            watcher()
+        return event
+
+    def since(self, seq, limit=1000, ids=None):
+        """Return (events after seq, cursor to resume from, reset)
+
+        `ids` limits the events to those documents; the cursor still moves
+        past the ones skipped.
+        """
+        with self._changed:
+            return self._since(seq, limit, ids)
+
+    def wait(self, seq, timeout, limit=1000, ids=None):
+        """Like since(), but block up to `timeout` seconds for a matching event"""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                events, cursor, reset = self._since(seq, limit, ids)
+                remaining = deadline - time.monotonic()
+                if events or reset or remaining <= 0:
+                    return events, cursor, reset
+                seq = cursor
+                self._changed.wait(remaining)
+
+    def _since(self, seq, limit, ids):
+        if seq is None or seq == self._seq:
+            return [], self._seq, False
+        first = self._events[0]["seq"] if self._events else self._seq + self.step
+        if seq > self._seq or seq < first - self.step or (self._seq - seq) % self.step:
+            return [], self._seq, True
+        events = []
+        cursor = seq
+        for i in range((seq - first) // self.step + 1, len(self._events)):
+            event = self._events[i]
+            cursor = event["seq"]
+            if ids is None or event["id"] in ids:
+                events.append(event)
+                if len(events) >= limit:
+                    break
+        return events, cursor, False
+
+
+def sse_message(events, cursor, reset):
+    """Server-sent event bytes for one since()/wait() result
+
+    Every message carries an id, so a reconnecting EventSource resumes from
+    `cursor` even when nothing it follows has changed yet.
+    """
+    if reset:
+        return b"id: %d\nevent: reset\ndata: {}\n\n" % cursor
+    if events:
+        return b"".join(b"id: %d\nevent: change\ndata: %s\n\n" % (event["seq"], dumps(event)) for event in events)
+    return b": keepalive\nid: %d\n\n" % cursor
@@ -0,0 +1,95 @@
+"""
+AI Document Processor - Pre-encoded document type configuration
+Serves /api/config/document-types from cached bytes with strong ETags
+"""
+
+import hashlib
+import json
+import threading
+
+# Clients may reuse a cached copy but must revalidate it (cheap 304) first
+CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+
+def _entry(value):
+    body = json.dumps(value).encode()
+    return body, '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def _template_version(document_type):
+    template = json.dumps(
+        [document_type.get("extractionTemplate"), document_type.get("validationRules")], sort_keys=True
+    ).encode()
+    return hashlib.sha256(template).hexdigest()[:16]
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header value matches `etag` (weak comparison, per RFC 9110)"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+class DocumentTypeCache:
+    """Document types indexed by id, with each response body encoded once
+
+    The list and every single type are serialized and hashed when the
+    configuration changes, not per request. Readers get an immutable
+    snapshot, so lookups don't take the lock. Listeners registered with
+    add_listener() are called with each type put() stores, so derived state
+    (compiled validators) is rebuilt only for the type that changed.
+    """
+
+    def __init__(self, document_types):
+        self._types = document_types
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._rebuild()
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def _rebuild(self):
+        by_id = {dt["id"]: dt for dt in self._types}
+        entries = {type_id: _entry(dt) for type_id, dt in by_id.items()}
+        versions = {type_id: _template_version(dt) for type_id, dt in by_id.items()}
+        self._snapshot = (by_id, _entry(self._types), entries, versions)
+
+    def get(self, type_id):
+        return self._snapshot[0].get(type_id)
+
+    def list_entry(self):
+        """(body, etag) for the full list"""
+        return self._snapshot[1]
+
+    def entry(self, type_id):
+        """(body, etag) for one type, or None"""
+        return self._snapshot[2].get(type_id)
+
+    def template_version(self, type_id):
+        """Short hash of a type's extractionTemplate and validationRules; changes whenever they do"""
+        return self._snapshot[3].get(type_id)
+
+    def put(self, document_type):
+        """Create or replace a document type; returns True if it was created"""
+        with self._lock:
+            for i, existing in enumerate(self._types):
+                if existing["id"] == document_type["id"]:
+                    self._types[i] = document_type
+                    created = False
+                    break
+            else:
+                self._types.append(document_type)
+                created = True
+            self._rebuild()
+        for callback in self._listeners:
+            callback(document_type)
+        return created
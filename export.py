@@ -0,0 +1,68 @@
+"""
+AI Document Processor - Bulk export
+NDJSON and CSV serialization of document iterators, one record at a time,
+for streaming exports of any size
+"""
+
+import csv
+import io
+
+from response_encoding import dumps
+
+# CSV columns ahead of the document type's extraction template fields
+CSV_COLUMNS = (
+    "id", "fileName", "documentTypeId", "uploadedAt", "status", "reviewStatus",
+    "reviewedAt", "reviewedBy", "confidence", "version",
+)
+
+CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def iter_ndjson(docs, projection=None):
+    """Yield one JSON line per document"""
+    for doc in docs:
+        yield dumps(projection.apply(doc) if projection is not None else doc) + b"\n"
+
+
+def template_fields(document_type):
+    """Ids of the document type's extraction template fields, in template order"""
+    fields = (document_type.get("extractionTemplate") or {}).get("fields") or []
+    return [field["id"] for field in fields if field.get("id")]
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        return dumps(value).decode("utf-8")
+    return value
+
+
+def iter_csv(docs, document_type):
+    """Yield a header row, then one row per document
+
+    Columns are CSV_COLUMNS followed by the type's template field ids,
+    filled from extractedData (blank where it isn't an object); nested
+    values are written as JSON. Rows go through a single reused buffer,
+    so memory doesn't grow with the export.
+    """
+    fields = template_fields(document_type)
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    def row(values):
+        buf.seek(0)
+        buf.truncate()
+        writer.writerow(values)
+        return buf.getvalue().encode("utf-8")
+
+    yield row(CSV_COLUMNS + tuple(fields))
+    for doc in docs:
+        data = doc.get("extractedData")
+        if not isinstance(data, dict):
+            # Stored before edits were checked; its fields are simply left blank
+            data = {}
+        yield row([_cell(doc.get(column)) for column in CSV_COLUMNS] + [_cell(data.get(field)) for field in fields])
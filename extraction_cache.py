@@ -0,0 +1,132 @@
+"""
+AI Document Processor - Content-addressed extraction result cache
+Processing results keyed by document content, type and template version
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+
+def cache_key(content_hash, ocr_text, document_type_id, template_version):
+    """Key for one processing result
+
+    The content part covers the uploaded file's hash (when there is one)
+    and the OCR text extraction reads, so a reprocess after the OCR text was
+    edited isn't answered with results for the old text.
+    """
+    content = hashlib.sha256(f"{content_hash or ''}\n{ocr_text or ''}".encode("utf-8")).hexdigest()
+    return f"{content}:{document_type_id}:{template_version}"
+
+
+class ExtractionCache:
+    """LRU cache of processing results, bounded by entry count and total size
+
+    Results are stored JSON-encoded, which gives an exact size to bound on
+    and hands every caller its own copy. With `path` set, entries are also
+    written through to a SQLite file and reloaded on startup, so results
+    survive a restart.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, path=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = str(path) if path else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (encoded result, id of the document it was computed for)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if self.path:
+            self._open()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS extraction_cache ("
+            " key TEXT PRIMARY KEY,"
+            " body BLOB NOT NULL,"
+            " document_id TEXT)"
+        )
+        self._db.commit()
+        rows = self._db.execute("SELECT key, body, document_id FROM extraction_cache ORDER BY rowid")
+        for key, body, document_id in rows:
+            self._store(key, bytes(body), document_id)
+        self._evict()
+
+    def get(self, key):
+        """Return (result, original document id), or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        body, document_id = entry
+        return json.loads(body), document_id
+
+    def put(self, key, result, document_id=None):
+        body = json.dumps(result, separators=(",", ":")).encode("utf-8")
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._store(key, body, document_id)
+            if self._db is not None:
+                with self._db:
+                    self._db.execute(
+                        "INSERT INTO extraction_cache (key, body, document_id) VALUES (?, ?, ?)"
+                        " ON CONFLICT(key) DO UPDATE SET body = excluded.body, document_id = excluded.document_id",
+                        (key, body, document_id),
+                    )
+            self._evict()
+
+    def _store(self, key, body, document_id):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old[0])
+        self._entries[key] = (body, document_id)
+        self._bytes += len(body)
+
+    def _evict(self):
+        evicted = []
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key, (body, _) = self._entries.popitem(last=False)
+            self._bytes -= len(body)
+            self.evictions += 1
+            evicted.append((key,))
+        if evicted and self._db is not None:
+            with self._db:
+                self._db.executemany("DELETE FROM extraction_cache WHERE key = ?", evicted)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,215 @@
+"""
+AI Document Processor - Background processing job queue
+Runs document processing off the request thread with a bounded backlog
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import queue
+import threading
+
+# Finished jobs are kept around for status queries, up to this many
+MAX_FINISHED_JOBS = 10000
+
+
+class QueueFull(Exception):
+    """The backlog is at capacity; the caller should retry later"""
+
+
+class Job:
+    """One processing run for one document: queued -> processing -> completed/failed"""
+
+    __slots__ = ("document_id", "state", "queued_at", "started_at", "finished_at", "error")
+
+    def __init__(self, document_id):
+        self.document_id = document_id
+        self.state = "queued"
+        self.queued_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+
+    @property
+    def finished(self):
+        return self.state in ("completed", "failed")
+
+    def to_dict(self):
+        return {
+            "documentId": self.document_id,
+            "state": self.state,
+            "queuedAt": self.queued_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """Bounded queue of processing jobs drained by a pool of workers
+
+    `mode="thread"` runs the work function on the worker threads themselves;
+    `mode="process"` hands it to a process pool of the same size so
+    CPU-heavy processing isn't limited by the GIL (the work function and its
+    arguments must then be picklable). Either way `on_done(document_id,
+    result)` or `on_error(document_id, exc)` runs on a worker thread in this
+    process, which is where results are written back to the store.
+    """
+
+    def __init__(self, workers=4, max_pending=1000, mode="thread"):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown processing mode: {mode}")
+        self.workers = workers
+        self.max_pending = max_pending
+        self.mode = mode
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._jobs = OrderedDict()
+        self._changed = threading.Condition()
+        self._threads = []
+        self._stopping = threading.Event()
+        self._executor = None
+        self._start_lock = threading.Lock()
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Call callback(job) whenever a job is queued or changes state"""
+        self._listeners.append(callback)
+
+    def _notify(self, job):
+        for listener in self._listeners:
+            listener(job)
+
+    @property
+    def depth(self):
+        """Jobs waiting for a worker"""
+        return self._pending.qsize()
+
+    def start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            if self.mode == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        """Stop the workers once their current jobs finish
+
+        Jobs still queued are dropped; their documents stay "processing",
+        so the next start resumes them. Never blocks on a full queue: it
+        makes room for each worker's stop marker by discarding queued jobs.
+        """
+        self._stopping.set()
+        for _ in self._threads:
+            while True:
+                try:
+                    self._pending.put_nowait(None)
+                    break
+                except queue.Full:
+                    try:
+                        self._pending.get_nowait()
+                    except queue.Empty:
+                        pass
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def submit(self, document_id, fn, args=(), on_done=None, on_error=None):
+        """Queue fn(*args) for a document; raises QueueFull when the backlog is full"""
+        self.start()
+        job = Job(document_id)
+        try:
+            self._pending.put_nowait((job, fn, args, on_done, on_error))
+        except queue.Full:
+            raise QueueFull(f"Processing queue is full ({self.max_pending} jobs pending)")
+        with self._changed:
+            self._jobs.pop(document_id, None)
+            self._jobs[document_id] = job
+            self._trim()
+            self._changed.notify_all()
+        self._notify(job)
+        return job
+
+    def record_completed(self, document_id):
+        """Register a job that finished without running, e.g. one answered from a cache"""
+        job = Job(document_id)
+        job.state = "completed"
+        job.started_at = job.finished_at = job.queued_at
+        with self._changed:
+            self._jobs.pop(document_id, None)
+            self._jobs[document_id] = job
+            self._trim()
+            self._changed.notify_all()
+        self._notify(job)
+        return job
+
+    def get(self, document_id):
+        with self._changed:
+            return self._jobs.get(document_id)
+
+    def wait(self, document_id, timeout):
+        """Block until the document's latest job finishes or `timeout` seconds pass"""
+        with self._changed:
+            self._changed.wait_for(
+                lambda: document_id not in self._jobs or self._jobs[document_id].finished,
+                timeout=timeout,
+            )
+            return self._jobs.get(document_id)
+
+    def _work(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                return
+            if self._stopping.is_set():
+                # Queued before stop(); left for the next start to resume
+                continue
+            job, fn, args, on_done, on_error = item
+            self._set_state(job, "processing")
+            try:
+                if self._executor is not None:
+                    result = self._executor.submit(fn, *args).result()
+                else:
+                    result = fn(*args)
+                if on_done is not None:
+                    on_done(job.document_id, result)
+            except Exception as e:
+                job.error = str(e)
+                if on_error is not None:
+                    try:
+                        on_error(job.document_id, e)
+                    except Exception:
+                        pass
+                self._set_state(job, "failed")
+            else:
+                self._set_state(job, "completed")
+
+    def _set_state(self, job, state):
+        with self._changed:
+            job.state = state
+            now = datetime.now().isoformat()
+            if state == "processing":
+                job.started_at = now
+            elif job.finished:
+                job.finished_at = now
+            self._changed.notify_all()
+        self._notify(job)
+
+    def _trim(self):
+        excess = len(self._jobs) - MAX_FINISHED_JOBS
+        if excess <= 0:
+            return
+        # Oldest first; jobs still queued or running are never dropped
+        for document_id, job in list(self._jobs.items()):
+            if excess <= 0:
+                break
+            if job.finished:
+                del self._jobs[document_id]
+                excess -= 1
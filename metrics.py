@@ -0,0 +1,256 @@
+"""
+AI Document Processor - Metrics and access logging
+Counters, gauges and histograms rendered in the Prometheus text format,
+plus an access log written off the request path
+"""
+
+from bisect import bisect_left
+import queue
+import sys
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base for counters and gauges: one number per combination of label values
+
+    With `collect` set, the values are read when the metrics are rendered
+    instead of being updated as things happen: collect() returns a number,
+    or {label values tuple: number}. That suits values something else
+    already tracks, such as a queue's depth or a cache's hit count.
+    """
+
+    kind = None
+
+    def __init__(self, name, help, labels=(), collect=None):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.collect = collect
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def render(self):
+        if self.collect is not None:
+            values = self.collect()
+            if not isinstance(values, dict):
+                values = {(): values}
+            with self._lock:
+                self._values = dict(values)
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            samples = sorted(self._values.items())
+        for label_values, value in samples:
+            lines.append(f"{self.name}{_labels(self.label_names, label_values)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """A value that only goes up, per combination of label values"""
+
+    kind = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down"""
+
+    kind = "gauge"
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                # per-bucket counts (not yet cumulative), sum, count
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            samples = sorted((labels, (list(entry[0]), entry[1], entry[2])) for labels, entry in self._values.items())
+        for label_values, (counts, total, count) in samples:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, label_values, le)} {cumulative}")
+            labels = _labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """The metrics one /metrics endpoint exposes, in registration order"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Duplicate metric: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=(), collect=None):
+        return self._add(Counter(name, help, labels, collect))
+
+    def gauge(self, name, help, labels=(), collect=None):
+        return self._add(Gauge(name, help, labels, collect))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        """The whole registry in the Prometheus text exposition format, as bytes"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+registry = Registry()
+
+
+class CountingWriter:
+    """Wraps a response stream and counts the bytes written through it"""
+
+    __slots__ = ("raw", "count")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.count = 0
+
+    def write(self, data):
+        self.count += len(data)
+        return self.raw.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+class AccessLog:
+    """Access log lines written by a background thread
+
+    write() only appends to a bounded queue, so a request never waits on
+    stdout or a slow disk; a writer thread drains the queue in batches.
+    When the queue is full, lines are dropped and counted rather than
+    blocking the request. close() writes out what is queued and, with
+    `close_stream`, closes the stream (a log file opened for this log).
+    """
+
+    def __init__(self, stream=None, max_pending=10000, batch_size=256, close_stream=False):
+        self.stream = stream
+        self.batch_size = batch_size
+        self.close_stream = close_stream
+        self.dropped = 0
+        self.closed = False
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="access-log", daemon=True)
+                self._thread.start()
+
+    def write(self, line):
+        if self.closed:
+            self.dropped += 1
+            return
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Flush what is queued, stop the writer thread and close an owned stream"""
+        with self._start_lock:
+            self.closed = True
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+            if self.close_stream and self.stream is not None:
+                self.stream.close()
+
+    def _run(self):
+        while True:
+            lines = [self._queue.get()]
+            while len(lines) < self.batch_size:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in lines
+            lines = [line for line in lines if line is not None]
+            if lines:
+                stream = self.stream or sys.stdout
+                try:
+                    stream.write("\n".join(lines) + "\n")
+                    stream.flush()
+                except (OSError, ValueError):
+                    self.dropped += len(lines)
+            if stop:
+                return
@@ -0,0 +1,116 @@
+"""
+AI Document Processor - Field projection (sparse fieldsets) for document responses
+"""
+
+from functools import lru_cache
+
+# What list endpoints return unless the client asks for more
+SUMMARY_FIELDS = (
+    "id", "fileName", "fileType", "fileSize", "uploadedAt", "documentTypeId",
+    "status", "reviewStatus", "confidence", "reviewedAt", "reviewedBy", "version",
+)
+# Stored with a document for the server's own use (its file's path on disk,
+# the worker that queued its processing); never sent to clients
+INTERNAL_FIELDS = ("storedFile", "processingWorker")
+
+
+def public(doc):
+    """The document without its INTERNAL_FIELDS"""
+    return {key: value for key, value in doc.items() if key not in INTERNAL_FIELDS}
+
+
+def _tree(paths):
+    """Turn dotted paths into a nested dict; True marks a selected leaf"""
+    tree = {}
+    for path in paths:
+        node = tree
+        parts = path.split(".")
+        for part in parts[:-1]:
+            child = node.get(part)
+            if child is True:
+                break
+            node = node.setdefault(part, {})
+        else:
+            node[parts[-1]] = True
+    return tree
+
+
+def _include(tree, value):
+    out = {}
+    for key, sub in tree.items():
+        if key not in value:
+            continue
+        if sub is True:
+            out[key] = value[key]
+        elif isinstance(value[key], dict):
+            out[key] = _include(sub, value[key])
+    return out
+
+
+def _exclude(tree, value):
+    out = dict(value)
+    for key, sub in tree.items():
+        if key not in out:
+            continue
+        if sub is True:
+            del out[key]
+        elif isinstance(out[key], dict):
+            out[key] = _exclude(sub, out[key])
+    return out
+
+
+class Projection:
+    """A compiled fields=/exclude= selection; apply() returns a new, smaller dict"""
+
+    __slots__ = ("include", "exclude")
+
+    def __init__(self, include=None, exclude=None):
+        self.include = _tree(include) if include is not None else None
+        if self.include is not None:
+            # Clients always get the id back so they can address the document
+            self.include["id"] = True
+            for field in INTERNAL_FIELDS:
+                self.include.pop(field, None)
+        # Without a selection, apply() hands records back as they are and
+        # the response encoder leaves the internal fields out
+        self.exclude = _tree(tuple(exclude) + INTERNAL_FIELDS) if exclude else None
+
+    def apply(self, doc):
+        if self.include is not None:
+            doc = _include(self.include, doc)
+        if self.exclude is not None:
+            doc = _exclude(self.exclude, doc)
+        return doc
+
+    def apply_all(self, docs):
+        return [self.apply(doc) for doc in docs]
+
+
+FULL = Projection()
+
+
+def _split(value):
+    return tuple(sorted(p.strip() for p in value.split(",") if p.strip())) if value else ()
+
+
+@lru_cache(maxsize=256)
+def _compile(fields, exclude, view):
+    if fields:
+        return Projection(fields, exclude)
+    if view == "summary":
+        return Projection(SUMMARY_FIELDS, exclude)
+    if exclude:
+        return Projection(None, exclude)
+    return FULL
+
+
+def from_query(query_params, default_view="full"):
+    """Projection for ?fields=a,b.c / ?exclude=x / ?view=summary|full
+
+    fields= takes precedence over view=; exclude= applies on top of either.
+    Compiled projections are cached, since clients repeat the same few.
+    """
+    fields = _split(query_params.get("fields", [""])[0])
+    exclude = _split(query_params.get("exclude", [""])[0])
+    view = query_params.get("view", [default_view])[0]
+    return _compile(fields, exclude, "summary" if view == "summary" else "full")
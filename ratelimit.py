@@ -0,0 +1,100 @@
+"""
+AI Document Processor - Rate limiting and load shedding
+Token buckets per client, and an overload signal from the processing
+queue's depth and recent request latency
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+
+class RateLimiter:
+    """One token bucket per client key
+
+    A client may spend `burst` tokens at once and earns back `rate` tokens
+    a second. A rate of 0 turns the limiter off. Only the `max_keys` most
+    recently seen clients are tracked; a client evicted for being idle
+    comes back with a full bucket, as it would have by then anyway.
+    """
+
+    def __init__(self, rate, burst=None, max_keys=100000):
+        self.rate = rate
+        self.burst = max(burst if burst is not None else rate, 1)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def acquire(self, key, cost=1):
+        """Spend `cost` tokens; returns 0 if they were available, else the seconds until they will be"""
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                tokens = self.burst
+            else:
+                tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            wait = 0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (min(cost, self.burst) - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class LoadShedder:
+    """Says when the server is too busy to take on more processing
+
+    Overloaded means the processing queue is at least `queue_high` full
+    (queue_load() returns how full, 0 to 1), or the moving average of
+    request latency is above `max_latency` seconds. observe() feeds the
+    average; requests refused while overloaded are quick and count too,
+    so the average recovers once the backlog clears. Either check is off
+    when its threshold is 0.
+    """
+
+    def __init__(self, queue_load, queue_high=0.8, max_latency=1.0, smoothing=0.05):
+        self.queue_load = queue_load
+        self.queue_high = queue_high
+        self.max_latency = max_latency
+        self.smoothing = smoothing
+        self.latency = 0.0
+
+    def observe(self, seconds):
+        # A lost update under concurrency only nudges the average slightly
+        self.latency += (seconds - self.latency) * self.smoothing
+
+    def overloaded(self):
+        """The reason the server is overloaded ("queue" or "latency"), or None"""
+        if self.queue_high > 0 and self.queue_load() >= self.queue_high:
+            return "queue"
+        if self.max_latency > 0 and self.latency > self.max_latency:
+            return "latency"
+        return None
+
+
+def parse_limits(value, option, names):
+    """Parse "api=100,processing=5" into {"api": 100.0, "processing": 5.0}"""
+    result = {}
+    for part in (value or "").split(","):
+        if not part.strip():
+            continue
+        name, _, number = part.partition("=")
+        name = name.strip()
+        if name not in names:
+            raise ValueError(f"{option}: unknown budget '{name}' (expected one of {', '.join(names)})")
+        try:
+            result[name] = float(number)
+        except ValueError:
+            raise ValueError(f"{option}: '{part.strip()}' is not budget=number")
+        if result[name] < 0:
+            raise ValueError(f"{option}: '{name}' can't be negative")
+    return result
@@ -0,0 +1,266 @@
+"""
+AI Document Processor - Compact document records
+A __slots__ record per document instead of nested dicts, with interned
+enum values and OCR text kept compressed in a shared side store
+"""
+
+from collections.abc import Mapping
+import hashlib
+import sys
+import threading
+import zlib
+
+# Known values for the enum-like fields; each is stored as one shared string
+STATUSES = ("uploaded", "processing", "completed", "failed", "needs-review")
+REVIEW_STATUSES = ("pending", "approved", "rejected")
+_CANONICAL = {value: value for value in STATUSES + REVIEW_STATUSES + ("en", "application/pdf")}
+
+# OCR text shorter than this stays inline; compressing it wouldn't pay off
+INLINE_TEXT_LIMIT = 256
+
+
+def intern_value(value):
+    """Return the one shared instance of a repeated string value"""
+    if not isinstance(value, str):
+        return value
+    canonical = _CANONICAL.get(value)
+    return canonical if canonical is not None else sys.intern(value)
+
+
+class TextStore:
+    """Content-addressed, zlib-compressed storage for large text blobs
+
+    Records hold a digest instead of the text. Identical texts are stored
+    once, and because a digest never changes meaning, an old record snapshot
+    still reads the text it was created with. Blobs are reference counted
+    by the DocumentStore and dropped when no record uses them.
+    """
+
+    def __init__(self):
+        self._blobs = {}
+        self._refs = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def key_for(self, text):
+        """Store `text` if needed and return what a record should hold for it"""
+        if len(text) < INLINE_TEXT_LIMIT:
+            return text
+        data = text.encode("utf-8")
+        key = hashlib.blake2b(data, digest_size=16).digest()
+        if key not in self._blobs:
+            with self._lock:
+                self._blobs.setdefault(key, zlib.compress(data, 6))
+        return key
+
+    def get(self, key):
+        if isinstance(key, str):
+            return key
+        return zlib.decompress(self._blobs[key]).decode("utf-8")
+
+    def incref(self, key):
+        if isinstance(key, bytes):
+            with self._lock:
+                self._refs[key] = self._refs.get(key, 0) + 1
+
+    def decref(self, key):
+        if isinstance(key, bytes):
+            with self._lock:
+                count = self._refs.get(key, 0) - 1
+                if count > 0:
+                    self._refs[key] = count
+                else:
+                    self._refs.pop(key, None)
+                    self._blobs.pop(key, None)
+
+    def compressed_size(self):
+        return sum(len(blob) for blob in self._blobs.values())
+
+
+# JSON key -> slot for the flat top-level fields, in the order they serialize
+_FIELDS = (
+    ("id", "id"),
+    ("fileName", "file_name"),
+    ("fileType", "file_type"),
+    ("fileSize", "file_size"),
+    ("uploadedAt", "uploaded_at"),
+    ("documentTypeId", "document_type_id"),
+    ("status", "status"),
+    ("extractedData", "extracted_data"),
+    ("ocrText", None),
+    ("confidence", "confidence"),
+    ("processingErrors", None),
+    ("metadata", None),
+    ("reviewStatus", "review_status"),
+    ("comments", "comments"),
+    ("contentHash", "content_hash"),
+    ("reviewedAt", "reviewed_at"),
+    ("reviewedBy", "reviewed_by"),
+    ("version", "version"),
+)
+_SLOT_FOR = {key: slot for key, slot in _FIELDS if slot}
+_INTERNED = frozenset(("file_type", "document_type_id", "status", "review_status", "reviewed_by"))
+_METADATA_KEYS = frozenset(("pageCount", "language", "classification", "entities"))
+# Slot value for keys the document doesn't have, so absent and null stay distinct
+MISSING = object()
+
+
+class DocumentRecord(Mapping):
+    """One document, laid out in slots; reads like the JSON dict it replaces
+
+    Records are immutable: with_changes() returns a new record, sharing
+    every untouched value with the old one. Unknown top-level keys (clients
+    may PUT anything) go in `extra`. Slots for keys the document lacks hold
+    MISSING, so to_dict() gives back exactly the keys that were put in.
+    """
+
+    __slots__ = (
+        "id", "file_name", "file_type", "file_size", "uploaded_at", "document_type_id",
+        "status", "extracted_data", "ocr_key", "confidence", "processing_errors",
+        "page_count", "language", "classification_type", "classification_confidence",
+        "entities", "metadata_extra", "review_status", "comments", "content_hash",
+        "reviewed_at", "reviewed_by", "version", "extra", "texts",
+    )
+
+    @classmethod
+    def from_dict(cls, doc, texts):
+        record = cls.__new__(cls)
+        for slot in cls.__slots__:
+            object.__setattr__(record, slot, MISSING)
+        object.__setattr__(record, "extra", None)
+        object.__setattr__(record, "texts", texts)
+        record._assign(doc)
+        return record
+
+    def with_changes(self, changes):
+        record = DocumentRecord.__new__(DocumentRecord)
+        for slot in DocumentRecord.__slots__:
+            object.__setattr__(record, slot, getattr(self, slot))
+        record._assign(changes)
+        return record
+
+    def _assign(self, changes):
+        set_ = object.__setattr__
+        extra = dict(self.extra) if self.extra else None
+        for key, value in changes.items():
+            slot = _SLOT_FOR.get(key)
+            if slot is not None:
+                set_(self, slot, intern_value(value) if slot in _INTERNED else value)
+            elif key == "ocrText":
+                set_(self, "ocr_key", self.texts.key_for(value if isinstance(value, str) else str(value)))
+            elif key == "processingErrors":
+                set_(self, "processing_errors", tuple(value) if isinstance(value, list) else value)
+            elif key == "metadata":
+                self._assign_metadata(value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        set_(self, "extra", extra or None)
+
+    def _assign_metadata(self, metadata):
+        set_ = object.__setattr__
+        for slot in ("page_count", "language", "classification_type", "classification_confidence", "entities"):
+            set_(self, slot, MISSING)
+        if not isinstance(metadata, dict):
+            # Not the usual shape; keep it verbatim
+            set_(self, "metadata_extra", {"": metadata})
+            return
+        set_(self, "page_count", metadata.get("pageCount", MISSING))
+        set_(self, "language", intern_value(metadata.get("language", MISSING)))
+        extra = {k: v for k, v in metadata.items() if k not in _METADATA_KEYS}
+        classification = metadata.get("classification", MISSING)
+        if isinstance(classification, dict) and list(classification) == ["type", "confidence"]:
+            set_(self, "classification_type", intern_value(classification["type"]))
+            set_(self, "classification_confidence", classification["confidence"])
+        elif classification is not MISSING:
+            extra["classification"] = classification
+        entities = metadata.get("entities", MISSING)
+        set_(self, "entities", tuple(entities) if isinstance(entities, list) else entities)
+        set_(self, "metadata_extra", extra)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("DocumentRecord is immutable; use with_changes()")
+
+    @property
+    def ocr_text(self):
+        return self.texts.get(self.ocr_key) if self.ocr_key is not MISSING else None
+
+    def metadata(self):
+        extra = self.metadata_extra
+        if extra is MISSING:
+            return MISSING
+        if "" in extra:
+            return extra[""]
+        out = {}
+        if self.page_count is not MISSING:
+            out["pageCount"] = self.page_count
+        if self.language is not MISSING:
+            out["language"] = self.language
+        if self.classification_type is not MISSING:
+            out["classification"] = {"type": self.classification_type, "confidence": self.classification_confidence}
+        if self.entities is not MISSING:
+            out["entities"] = list(self.entities) if isinstance(self.entities, tuple) else self.entities
+        out.update(extra)
+        return out
+
+    def _value(self, key):
+        slot = _SLOT_FOR.get(key)
+        if slot is not None:
+            return getattr(self, slot)
+        if key == "ocrText":
+            return self.texts.get(self.ocr_key) if self.ocr_key is not MISSING else MISSING
+        if key == "processingErrors":
+            errors = self.processing_errors
+            return list(errors) if isinstance(errors, tuple) else errors
+        if key == "metadata":
+            return self.metadata()
+        if self.extra is not None:
+            return self.extra.get(key, MISSING)
+        return MISSING
+
+    def __getitem__(self, key):
+        value = self._value(key)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        for key, _ in _FIELDS:
+            if self._value(key) is not MISSING:
+                yield key
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        return self._value(key) is not MISSING
+
+    def get(self, key, default=None):
+        value = self._value(key)
+        return default if value is MISSING else value
+
+    def to_dict(self):
+        """The JSON shape the frontend's Document type expects"""
+        out = {}
+        for key, _ in _FIELDS:
+            value = self._value(key)
+            if value is not MISSING:
+                out[key] = value
+        if self.extra is not None:
+            out.update(self.extra)
+        return out
+
+    def __repr__(self):
+        return f"DocumentRecord({self.get('id')!r}, status={self.get('status')!r})"
+
+
+def to_json_compatible(obj):
+    """`default=` hook for JSON encoders so records serialize as plain dicts"""
+    if isinstance(obj, DocumentRecord):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,127 @@
+"""
+AI Document Processor - JSON response encoding
+Compact serialization (orjson when installed), gzip/deflate negotiation
+and chunked streaming for large list payloads
+"""
+
+import json
+import zlib
+
+try:
+    import orjson
+except ImportError:  # optional dependency; the stdlib encoder is the fallback
+    orjson = None
+
+from projection import public
+from records import DocumentRecord, to_json_compatible
+
+# Bodies smaller than this aren't worth compressing
+MIN_COMPRESS_SIZE = 1024
+# Streamed responses are written in chunks of about this size
+CHUNK_SIZE = 64 * 1024
+
+
+def _default(obj):
+    # Records go out without their internal fields; the store still writes them whole
+    if isinstance(obj, DocumentRecord):
+        return public(obj)
+    return to_json_compatible(obj)
+
+
+_encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=_default)
+
+
+def dumps(obj):
+    """Serialize to compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default)
+        except TypeError:
+            # e.g. non-string dict keys, which the stdlib encoder coerces
+            pass
+    return _encoder.encode(obj).encode("utf-8")
+
+
+def negotiate(accept_encoding):
+    """Pick gzip or deflate from an Accept-Encoding header, or None for identity"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in ("gzip", "deflate"):
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def _compressobj(encoding):
+    # wbits 31 writes a gzip container; 15 writes zlib, which is what HTTP calls "deflate"
+    return zlib.compressobj(6, zlib.DEFLATED, 31 if encoding == "gzip" else 15)
+
+
+def compress(body, encoding):
+    compressor = _compressobj(encoding)
+    return compressor.compress(body) + compressor.flush()
+
+
+def encode_response(payload, accept_encoding=None):
+    """Return (body, headers) for a JSON payload, compressed if the client accepts it"""
+    body = dumps(payload)
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = negotiate(accept_encoding) if len(body) >= MIN_COMPRESS_SIZE else None
+    if encoding:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return body, headers
+
+
+def iter_list_json(items, meta=None):
+    """Yield {"items": [...], **meta} as JSON one item at a time"""
+    yield b'{"items":['
+    for i, item in enumerate(items):
+        yield (b"," if i else b"") + dumps(item)
+    tail = dumps(meta) if meta else b"{}"
+    yield b"]" + (b"," + tail[1:] if len(tail) > 2 else b"}")
+
+
+def iter_compressed(chunks, encoding):
+    compressor = _compressobj(encoding)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def coalesce(chunks, size=CHUNK_SIZE):
+    """Merge small pieces into writes of roughly `size` bytes"""
+    buf = []
+    pending = 0
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buf.append(chunk)
+        pending += len(chunk)
+        if pending >= size:
+            yield b"".join(buf)
+            buf = []
+            pending = 0
+    if buf:
+        yield b"".join(buf)
+
+
+def write_chunked(wfile, chunks):
+    """Write an iterable of bytes with HTTP/1.1 chunked transfer encoding"""
+    for chunk in chunks:
+        if chunk:
+            wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+    wfile.write(b"0\r\n\r\n")
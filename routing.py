@@ -0,0 +1,124 @@
+"""
+AI Document Processor - Request routing
+Route table compiled into a trie of path segments with typed parameters
+"""
+
+from functools import partial
+from urllib.parse import unquote
+
+# Parameter types usable in patterns as {name:type}; {name} means str
+CONVERTERS = {"str": str, "int": int}
+
+
+class Route:
+    """One (method, pattern) entry: the handler plus its middleware chain
+
+    Middleware are callables mw(handler, call_next); each runs before the
+    ones after it and decides whether to call call_next() at all.
+    """
+
+    __slots__ = ("method", "pattern", "handler", "middleware")
+
+    def __init__(self, method, pattern, handler, middleware=()):
+        self.method = method
+        self.pattern = pattern
+        self.handler = handler
+        self.middleware = tuple(middleware)
+
+    def __call__(self, request_handler, params):
+        call = partial(self.handler, request_handler, **params)
+        for middleware in reversed(self.middleware):
+            call = partial(middleware, request_handler, call)
+        call()
+
+
+class _Node:
+    __slots__ = ("static", "param", "routes")
+
+    def __init__(self):
+        self.static = {}
+        # (name, converter, child node) for a {parameter} segment
+        self.param = None
+        self.routes = {}
+
+
+def _segments(path):
+    parts = path.split("/")[1:]
+    if parts and parts[-1] == "":
+        parts.pop()
+    return parts
+
+
+class Router:
+    """Maps (method, path) to a Route
+
+    Lookup walks one trie node per path segment, so its cost depends on the
+    path's depth, not on how many routes exist. Literal segments win over
+    parameters ("/api/documents/search" before "/api/documents/{doc_id}"),
+    and a parameter only ever matches one whole segment, so an id that
+    happens to contain "approve" can't reach the approve route.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+
+    def add(self, method, pattern, handler, middleware=()):
+        node = self._root
+        for segment in _segments(pattern):
+            if segment.startswith("{") and segment.endswith("}"):
+                name, _, kind = segment[1:-1].partition(":")
+                converter = CONVERTERS[kind or "str"]
+                if node.param is None:
+                    node.param = (name, converter, _Node())
+                elif node.param[:2] != (name, converter):
+                    raise ValueError(f"{pattern}: conflicts with parameter '{node.param[0]}' at the same position")
+                node = node.param[2]
+            else:
+                node = node.static.setdefault(segment, _Node())
+        if method in node.routes:
+            raise ValueError(f"Duplicate route: {method} {pattern}")
+        route = node.routes[method] = Route(method, pattern, handler, middleware)
+        return route
+
+    def route(self, method, pattern, middleware=()):
+        """Decorator form of add()"""
+        def register(handler):
+            self.add(method, pattern, handler, middleware)
+            return handler
+        return register
+
+    def resolve(self, method, path):
+        """Return (route, params, allowed methods)
+
+        route is None when nothing handles `method` here: allowed is then
+        empty for an unknown path (404), or the methods the path does
+        support (405).
+        """
+        allowed = ()
+        for node, params in self._walk(self._root, _segments(path), 0, {}):
+            route = node.routes.get(method)
+            if route is not None:
+                return route, params, node.routes.keys()
+            if not allowed:
+                allowed = node.routes.keys()
+        return None, None, sorted(allowed)
+
+    def _walk(self, node, segments, i, params):
+        """Yield (node, params) for every routed node matching segments[i:], literal matches first"""
+        if i == len(segments):
+            if node.routes:
+                yield node, params
+            return
+        child = node.static.get(segments[i])
+        if child is not None:
+            yield from self._walk(child, segments, i + 1, params)
+        if node.param is not None:
+            name, converter, child = node.param
+            value = unquote(segments[i])
+            if not value:
+                return
+            try:
+                value = converter(value)
+            except ValueError:
+                return
+            yield from self._walk(child, segments, i + 1, dict(params, **{name: value}))
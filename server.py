@@ -4,16 +4,96 @@ AI Document Processor - Backend Server (Mock Implementation)
 Provides REST API endpoints for document processing
 """
 
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import HTTPServer, ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
+import argparse
+import asyncio
 import json
+import math
 import os
+import queue
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
 import uuid
 from datetime import datetime
+from functools import wraps
 from pathlib import Path
 
-# In-memory storage
-documents = {}
+from async_server import AsyncHTTPServer
+from changes import ChangeFeed, sse_message
+from config_cache import CACHE_CONTROL, DocumentTypeCache, etag_matches
+from document_store import DocumentStore, VersionConflict, decode_cursor, encode_cursor, version_of
+from export import CONTENT_TYPES as EXPORT_CONTENT_TYPES, iter_csv, iter_ndjson
+from extraction_cache import ExtractionCache, cache_key
+from jobs import JobQueue, QueueFull
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, AccessLog, CountingWriter, registry
+from pipeline import Pipeline, parse_stage_options
+import projection
+from ratelimit import LoadShedder, RateLimiter, parse_limits
+from response_encoding import coalesce, encode_response, iter_compressed, iter_list_json, negotiate, write_chunked
+from records import STATUSES
+from routing import Router
+from static_files import StaticFiles
+from storage import open_backend
+from uploads import BodyReader, UploadError, parse_header_params, spool_multipart, spool_raw
+from validation import check_document_type, parse_currency, parse_date, validators
+
+# Document storage, indexed by status, reviewStatus and documentTypeId.
+# In memory by default; configure_store() switches to a persistent backend.
+documents = DocumentStore()
+# Every write to the store, as sequence-numbered diffs for /api/documents/changes
+change_feed = ChangeFeed()
+documents.add_listener(change_feed.record)
+
+# Uploaded files are streamed here; JSON request bodies are capped instead
+UPLOAD_DIR = Path(os.environ.get("UPLOAD_DIR", "uploads"))
+MAX_JSON_BODY = 1024 * 1024
+# Most items a single batch request may carry
+MAX_BATCH = 1000
+# List responses with at least this many items are streamed with chunked encoding
+STREAM_MIN_ITEMS = 100
+
+# app.html and other whitelisted files next to this script
+static_files = StaticFiles(os.path.dirname(os.path.abspath(__file__)), index=("app.html",), aliases=("/app.html",))
+
+# Processing runs on background workers; configure_processing() resizes the pool.
+# Each worker carries one document through the pipeline's stages.
+job_queue = JobQueue(workers=16, max_pending=1000)
+pipeline = Pipeline()
+# Longest a status request may long-poll for a job to finish
+MAX_STATUS_WAIT = 60
+# Sent with every response
+CORS_HEADERS = (
+    ("Access-Control-Allow-Origin", "*"),
+    ("Access-Control-Allow-Methods", "GET, POST, PUT, PATCH, DELETE, OPTIONS"),
+    ("Access-Control-Allow-Headers", "Content-Type, If-Match, If-None-Match"),
+    ("Access-Control-Expose-Headers", "ETag, Retry-After"),
+)
+# Per-client request budgets: tokens per second and burst size. Every API
+# request spends from "api"; uploads and reprocessing also spend from
+# "processing", so one client looping on them can't starve everyone else.
+RATE_LIMITS = {"api": 100, "processing": 5}
+RATE_BURSTS = {"api": 200, "processing": 50}
+# Not charged to any budget, so monitoring keeps working
+UNLIMITED_ROUTES = frozenset(("/api/health", "/api/metrics"))
+# Slow by design; left out of the latency average load shedding watches
+LONG_POLL_ROUTES = frozenset(("/api/documents/changes", "/api/documents/changes/stream", "/api/documents/{doc_id}/status"))
+# Retry-After for work refused while the server is overloaded
+SHED_RETRY_AFTER = 5
+# A change stream is closed after this long (EventSource reconnects and resumes);
+# a comment line is sent when nothing changed for STREAM_HEARTBEAT seconds
+MAX_STREAM_SECONDS = 300
+STREAM_HEARTBEAT = 15
+# Results of earlier processing runs, keyed by content; configure_cache() resizes it
+extraction_cache = ExtractionCache()
+# Request log lines are written by a background thread; configure_access_log() redirects them
+access_log = AccessLog()
+# This process's place among the server processes sharing one store; configure_workers() sets it
+worker_index, worker_count = 0, 1
 document_types = [
     {
         "id": "invoice",
@@ -76,371 +156,1669 @@ document_types = [
     },
 ]
 
-def simulate_ai_processing(document_type_id, ocr_text=""):
-    """Simulate AI processing of documents"""
+# Pre-encoded responses for /api/config/document-types, rebuilt when a type changes
+document_type_cache = DocumentTypeCache(document_types)
+# Validators are compiled per type and recompiled when a type is replaced
+document_type_cache.add_listener(validators.update)
+
+def get_document_type(type_id):
+    """The document type with this id, or None (also for ids that aren't strings)"""
+    return document_type_cache.get(type_id) if isinstance(type_id, str) else None
+
+def validate_document_type(data):
+    """Return an error message for a malformed document type definition, or None"""
+    if not isinstance(data, dict):
+        return "Document type must be an object"
+    for key in ("id", "name"):
+        if not isinstance(data.get(key), str) or not data[key]:
+            return f"'{key}' is required"
+    template = data.get("extractionTemplate")
+    if not isinstance(template, dict) or not isinstance(template.get("fields"), list):
+        return "'extractionTemplate.fields' must be a list"
+    for field in template["fields"]:
+        if not (isinstance(field, dict) and field.get("id") and isinstance(field["id"], str)
+                and field.get("type") and isinstance(field["type"], str)):
+            return "Every template field needs an 'id' and a 'type'"
+        if field.get("pattern") is not None and not isinstance(field["pattern"], str):
+            return f"Field '{field['id']}': 'pattern' must be a string"
+    rules = data.get("validationRules", [])
+    if not isinstance(rules, list):
+        return "'validationRules' must be a list"
+    for rule in rules:
+        if isinstance(rule, dict) and rule.get("rule") is not None and not isinstance(rule["rule"], str):
+            return f"Rule '{rule.get('id')}': 'rule' must be a string"
+    return check_document_type(data)
+
+def process_document(document_type_id, ocr_text, metadata=None):
+    """Run AI processing and return the fields to write back to the document
+
+    Runs on a job queue worker, which waits while the document goes through
+    the pipeline's OCR, classification, extraction and validation stages.
+    """
+    document_type = get_document_type(document_type_id)
+    if document_type is None:
+        raise ValueError(f"Unknown document type: {document_type_id}")
+    return pipeline.process(document_type, ocr_text, metadata)
+
+def _processing_done(doc_id, changes):
+    documents.update(doc_id, changes)
+
+def _processing_failed(doc_id, error):
+    documents.update(doc_id, {"status": "failed", "processingErrors": [str(error)]})
+
+def extraction_key(doc):
+    """Extraction cache key, or None for documents without uploaded content
+
+    A JSON metadata upload has no file, only OCR text made up from its file
+    name, so unrelated documents with the same name would share a result.
+    """
+    if not doc.get("contentHash"):
+        return None
+    type_id = doc["documentTypeId"]
+    return cache_key(doc.get("contentHash"), doc.get("ocrText"), type_id, document_type_cache.template_version(type_id))
+
+def enqueue_processing(doc):
+    """Queue a document for processing; raises QueueFull when the backlog is full
+
+    Content already processed with the same type and template is answered
+    from the extraction cache right away, without queueing a job.
+    """
+    key = extraction_key(doc)
+    cached = extraction_cache.get(key) if key is not None else None
+    if cached is not None:
+        _processing_done(doc["id"], cached[0])
+        return job_queue.record_completed(doc["id"])
+
+    def on_done(doc_id, changes):
+        if key is not None:
+            extraction_cache.put(key, changes, doc_id)
+        _processing_done(doc_id, changes)
+
+    return job_queue.submit(
+        doc["id"], process_document, (doc["documentTypeId"], doc["ocrText"], doc.get("metadata")),
+        on_done=on_done, on_error=_processing_failed,
+    )
+
+def configure_cache(max_entries=10000, max_bytes=64 * 1024 * 1024, path=None):
+    """Replace the extraction result cache; `path` persists it to a SQLite file"""
+    global extraction_cache
+    extraction_cache = ExtractionCache(max_entries, max_bytes, path)
+    return extraction_cache
+
+def configure_processing(workers=16, max_pending=1000, mode="thread", stage_workers=None, stage_batches=None):
+    """Replace the processing job queue and pipeline (call before serving requests)
+
+    `workers` bounds how many documents are in the pipeline at once; the
+    stages' own pools do the work. `mode="process"` runs the CPU-heavy
+    stages in process pools.
+    """
+    global job_queue, pipeline
+    pipeline = Pipeline(stage_workers, stage_batches, mode)
+    pipeline.start()
+    job_queue = JobQueue(workers=workers, max_pending=max_pending)
+    job_queue.start()
+    return job_queue
+
+def configure_store(kind="memory", path=None, shared=False):
+    """Replace the document store, loading any documents the backend already holds
+
+    `shared` is for several server processes on one database: each applies
+    the others' writes before handling a request and in the background.
+    """
+    global documents
+    documents = DocumentStore(open_backend(kind, path, shared))
+    documents.add_listener(change_feed.record)
+    if shared:
+        documents.follow()
+    return documents
+
+def configure_change_feed(start=None, step=1):
+    """Replace the change feed; server processes sharing a store each get their own start and step"""
+    global change_feed
+    documents.remove_listener(change_feed.record)
+    change_feed = ChangeFeed(start=start, step=step)
+    documents.add_listener(change_feed.record)
+    return change_feed
+
+def configure_workers(index=0, count=1):
+    """Set this process's index among `count` server processes sharing the store"""
+    global worker_index, worker_count
+    worker_index, worker_count = index, count
+
+def processing_owner(doc):
+    """Index of the server process that queued this document's processing"""
+    owner = doc.get("processingWorker")
+    return owner if isinstance(owner, int) and not isinstance(owner, bool) else 0
+
+def mark_processing():
+    """Changes that mark a document as queued for processing by this process"""
+    return {"status": "processing", "processingWorker": worker_index}
+
+def resume_pending_processing():
+    """Requeue documents a previous run left mid-processing; returns how many were queued
+
+    With several processes on one store, each resumes only the documents
+    it had queued, so a restarted worker picks its own jobs back up
+    without repeating ones a running sibling still has in hand.
+    """
+    pending, _ = documents.query({"status": "processing"}, 0, len(documents))
+    queued = 0
+    for doc in pending:
+        if processing_owner(doc) % worker_count != worker_index:
+            continue
+        try:
+            enqueue_processing(doc)
+        except QueueFull:
+            documents.update(doc["id"], {"status": "failed", "processingErrors": ["Processing was interrupted; reprocess the document"]})
+            continue
+        queued += 1
+    return queued
+
+def create_document(doc_type, file_name, file_type="application/pdf", file_size=None, content_hash=None):
+    """Build the record for a new upload; it is processed later by the job queue"""
     import random
-    from datetime import date
     
-    templates = {
-        "invoice": {
-            "invoice_number": f"INV-{random.randint(10000, 99999)}",
-            "invoice_date": date.today().isoformat(),
-            "vendor_name": "Sample Vendor Inc.",
-            "total_amount": str(random.randint(1000, 50000)),
-            "description": "Sample invoice description extracted from OCR",
-        },
-        "receipt": {
-            "receipt_number": f"RCP-{random.randint(10000, 99999)}",
-            "receipt_date": date.today().isoformat(),
-            "vendor_name": "Retail Store",
-            "amount": str(random.randint(100, 5000)),
-        },
-        "contract": {
-            "contract_title": "Service Agreement",
-            "parties": "Party A and Party B",
-            "effective_date": date.today().isoformat(),
-            "contract_terms": "Terms and conditions extracted from document",
+    doc_id = f"DOC-{str(uuid.uuid4())[:8].upper()}"
+    ocr_text = f"Sample OCR text extracted from {file_name}"
+    
+    document = {
+        "id": doc_id,
+        "fileName": file_name,
+        "fileType": file_type,
+        "fileSize": file_size if file_size is not None else random.randint(100000, 5000000),
+        "uploadedAt": datetime.now().isoformat(),
+        "documentTypeId": doc_type["id"],
+        "status": "processing",
+        "processingWorker": worker_index,
+        "extractedData": {},
+        "ocrText": ocr_text,
+        "confidence": 0.0,
+        "processingErrors": [],
+        "metadata": {
+            "pageCount": 1,
+            "language": "en",
+            "classification": {
+                "type": doc_type["name"],
+                "confidence": 0.92
+            },
+            "entities": []
         },
+        "reviewStatus": "pending",
+        "comments": ""
     }
-    return templates.get(document_type_id, {})
+    if content_hash:
+        document["contentHash"] = content_hash
+    return document
+
+def stored_path(doc):
+    """Path of the document's uploaded file under UPLOAD_DIR, or None if it has none
+
+    Each document's file is named after its id, so a document can only
+    ever point at (and delete) its own file. Documents stored before
+    `storedFile` was recorded fall back to the original naming scheme.
+    """
+    name = doc.get("storedFile")
+    if name is None and doc.get("contentHash") and not doc.get("duplicateOf"):
+        name = doc["id"] + Path(doc.get("fileName") or "").suffix.lower()
+    if not isinstance(name, str) or Path(name).name != name or Path(name).stem != doc["id"]:
+        return None
+    return UPLOAD_DIR / name
+
+def remove_stored_file(doc):
+    """Delete the document's uploaded file; copies linked from it by duplicates stay"""
+    path = stored_path(doc) if doc is not None else None
+    if path is not None:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+def find_original(content_hash):
+    """The earliest stored document with these file contents whose file still exists, or None"""
+    if not content_hash:
+        return None
+    page, _ = documents.query({"contentHash": content_hash}, 0, 1,
+                              predicate=lambda doc: (path := stored_path(doc)) is not None and path.exists())
+    return page[0] if page else None
+
+def document_from_upload(doc_type, upload, file_name=None):
+    """Create the record for a spooled upload and move the file to its final name
+
+    A file whose contents were uploaded before isn't stored again: the new
+    document's file is a hard link to the original's, so deleting either
+    document leaves the other's file in place, and it links to the original
+    with `duplicateOf` and reuses its OCR output, which also lets processing
+    hit the extraction cache. Where hard links aren't available the upload
+    is kept as its own copy.
+    """
+    # Browsers on Windows may send a full client-side path as the filename
+    file_name = Path((file_name or upload.filename or "document").replace("\\", "/")).name or "document"
+    document = create_document(doc_type, file_name, upload.content_type, upload.size, upload.sha256)
+    document["storedFile"] = document["id"] + Path(file_name).suffix.lower()
+    path = UPLOAD_DIR / document["storedFile"]
+    original = find_original(upload.sha256)
+    if original is None:
+        upload.move_to(path)
+        return document
+    try:
+        os.link(stored_path(original), path)
+    except OSError:
+        # No hard links here, or the original was deleted meanwhile
+        upload.move_to(path)
+    else:
+        upload.discard()
+    document["duplicateOf"] = original["id"]
+    if "ocrText" in original:
+        document["ocrText"] = original["ocrText"]
+    metadata = original.get("metadata")
+    if isinstance(metadata, dict):
+        for field in ("pageCount", "language", "entities"):
+            if field in metadata:
+                document["metadata"][field] = metadata[field]
+    return document
+
+# Route table for DocumentProcessorHandler; its methods register themselves with @routes.route
+limiters = {name: RateLimiter(rate, RATE_BURSTS[name]) for name, rate in RATE_LIMITS.items()}
+load_shedder = LoadShedder(lambda: job_queue.depth / job_queue.max_pending)
+
+def configure_limits(rates=None, bursts=None, queue_high=0.8, max_latency=1.0):
+    """Set the per-client budgets ({"api": per second, ...}; 0 turns one off) and load shedding thresholds
+
+    Processing work is refused with 503 once the queue is `queue_high`
+    full or the average request takes longer than `max_latency` seconds.
+    """
+    global load_shedder
+    rates = dict(RATE_LIMITS, **(rates or {}))
+    bursts = dict(RATE_BURSTS, **(bursts or {}))
+    for name, rate in rates.items():
+        limiters[name] = RateLimiter(rate, bursts[name])
+    load_shedder = LoadShedder(lambda: job_queue.depth / job_queue.max_pending, queue_high, max_latency)
+    return limiters, load_shedder
+
+def configure_access_log(target="-"):
+    """Send the access log to stdout ("-"), append it to a file, or turn it off ("off")"""
+    global access_log
+    if access_log is not None:
+        access_log.close()
+    if target == "off":
+        access_log = None
+    elif target == "-":
+        access_log = AccessLog()
+    else:
+        access_log = AccessLog(open(target, "a", encoding="utf-8"), close_stream=True)
+    return access_log
+
+# Request metrics, served at /api/metrics along with the pipeline's stage timings
+HTTP_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Time to handle a request", ("method", "route"))
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "Requests handled", ("method", "route", "status"))
+HTTP_REQUEST_BYTES = registry.counter(
+    "http_request_bytes_total", "Request body bytes, as declared by Content-Length", ("method", "route"))
+HTTP_RESPONSE_BYTES = registry.counter(
+    "http_response_bytes_total", "Response bytes written, headers included", ("method", "route"))
+HTTP_IN_FLIGHT = registry.gauge(
+    "http_requests_in_flight", "Requests being handled right now", ("method",))
+HTTP_REFUSED = registry.counter(
+    "http_requests_refused_total", "Requests refused by rate limits (429) or load shedding (503)", ("reason",))
+registry.gauge("http_request_latency_average_seconds", "Moving average of request latency, for load shedding",
+               collect=lambda: load_shedder.latency)
+registry.gauge("rate_limit_clients", "Clients with a tracked token bucket", ("budget",),
+               collect=lambda: {(name,): len(limiter) for name, limiter in limiters.items()})
+
+def _cache_stats():
+    caches = {"extraction": extraction_cache.stats()}
+    for name, fn in (("parse_date", parse_date), ("parse_currency", parse_currency)):
+        info = fn.cache_info()
+        caches[name] = {"hits": info.hits, "misses": info.misses, "entries": info.currsize}
+    return caches
+
+registry.gauge("document_store_documents", "Documents in the store", collect=lambda: len(documents))
+registry.gauge("document_store_documents_by_status", "Documents in the store by processing status", ("status",),
+               collect=lambda: {(status,): documents.count(status=status) for status in STATUSES})
+registry.gauge("processing_queue_depth", "Processing jobs waiting for a worker", collect=lambda: job_queue.depth)
+registry.gauge("pipeline_stage_queue_depth", "Items waiting at each pipeline stage", ("stage",),
+               collect=lambda: {(name,): depth for name, depth in pipeline.depths().items()})
+registry.gauge("extraction_cache_entries", "Results held in the extraction cache",
+               collect=lambda: extraction_cache.stats()["entries"])
+registry.gauge("extraction_cache_bytes", "Encoded size of the extraction cache",
+               collect=lambda: extraction_cache.stats()["bytes"])
+registry.counter("extraction_cache_evictions_total", "Results evicted from the extraction cache",
+                 collect=lambda: extraction_cache.stats()["evictions"])
+registry.counter("cache_hits_total", "Cache lookups answered from the cache", ("cache",),
+                 collect=lambda: {(name,): stats["hits"] for name, stats in _cache_stats().items()})
+registry.counter("cache_misses_total", "Cache lookups that missed", ("cache",),
+                 collect=lambda: {(name,): stats["misses"] for name, stats in _cache_stats().items()})
+registry.gauge("cache_hit_ratio", "Share of cache lookups that hit, since startup", ("cache",),
+               collect=lambda: {(name,): stats["hits"] / ((stats["hits"] + stats["misses"]) or 1)
+                                for name, stats in _cache_stats().items()})
+registry.gauge("change_feed_sequence", "Sequence number of the latest document change",
+               collect=lambda: change_feed.latest)
+registry.gauge("change_feed_subscribers", "Open change streams", collect=lambda: change_feed.subscribers)
+registry.gauge("access_log_queue_depth", "Access log lines waiting to be written",
+               collect=lambda: access_log.depth if access_log is not None else 0)
+registry.counter("access_log_dropped_total", "Access log lines dropped because the log couldn't keep up",
+                 collect=lambda: access_log.dropped if access_log is not None else 0)
+
+def document_etag(doc):
+    return f'"{version_of(doc)}"'
+
+def if_match_versions(header):
+    """Document versions an If-Match header allows a write to; None when any version will do
+
+    Tags are compared strongly, so weak (W/) tags match nothing.
+    """
+    if header is None:
+        return None
+    versions = set()
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return None
+        if len(tag) > 2 and tag[0] == tag[-1] == '"' and tag[1:-1].isdigit():
+            versions.add(int(tag[1:-1]))
+    return versions
+
+# Fields that place a document in the listing order and indexes; edits must keep them strings
+STRING_FIELDS = ("uploadedAt", "status", "reviewStatus", "documentTypeId")
+
+def validate_document_edit(body):
+    """Return an error message for a PUT or PATCH body that can't be applied, or None"""
+    for field in projection.INTERNAL_FIELDS:
+        if field in body:
+            return f"'{field}' can't be changed"
+    for field in STRING_FIELDS:
+        if field in body and not isinstance(body[field], str):
+            return f"'{field}' must be a string"
+    if "extractedData" in body and not isinstance(body["extractedData"], dict):
+        return "'extractedData' must be an object"
+    return None
+
+def revalidate(current, changes):
+    """Extra changes for an edit: user-edited extracted data is checked against the type's rules like extraction results are"""
+    if not isinstance(changes.get("extractedData"), dict):
+        return {}
+    doc_type = get_document_type(changes.get("documentTypeId") or current.get("documentTypeId"))
+    if doc_type is None:
+        return {}
+    return {"processingErrors": validators.validate(doc_type, changes["extractedData"])}
+
+def query_number(query_params, name, default, convert=int, minimum=None):
+    """A numeric query parameter, or `default` when it is absent or blank
+
+    Raises ValueError for anything that isn't a number of at least `minimum`.
+    """
+    value = query_params.get(name, [""])[0]
+    if not value:
+        return default
+    number = convert(value)
+    if minimum is not None and not number >= minimum:
+        raise ValueError(f"{name} must be at least {minimum}")
+    return number
+
+def client_key(headers, address):
+    """Who a request is charged to: the Bearer token it carries, else the client's address"""
+    auth = headers.get("Authorization", "")
+    if auth[:7].lower() == "bearer " and auth[7:].strip():
+        return "token:" + auth[7:].strip()
+    return "ip:" + address
+
+def change_feed_params(query_params, headers):
+    """(since, ids) for a change feed request; raises ValueError for a bad `since`
+
+    A Last-Event-ID header wins over `since`: EventSource sends it when it
+    reconnects, with the URL still carrying the original `since`.
+    """
+    since = headers.get("Last-Event-ID") or query_params.get("since", [""])[0]
+    since = int(since) if since else None
+    ids = query_params.get("ids", [""])[0]
+    return since, set(ids.split(",")) if ids else None
+
+def instrumented(method):
+    """Handler method decorator: time the request and count its bytes for /api/metrics
+
+    The method sets self.route_label to the route pattern it handled, so
+    ids in paths don't turn into one time series each. Load shedding
+    watches the time until the response started rather than the total, so
+    exports, large files and other streamed bodies, which take as long as
+    the client needs to read them, don't look like an overloaded server.
+    """
+    @wraps(method)
+    def handle(self):
+        self.route_label = None
+        self.response_status = None
+        self.response_started = None
+        sent = self.wfile.count
+        HTTP_IN_FLIGHT.inc(self.command)
+        started = time.perf_counter()
+        try:
+            method(self)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec(self.command)
+            route = self.route_label or "unmatched"
+            if route not in LONG_POLL_ROUTES:
+                load_shedder.observe((self.response_started or started + elapsed) - started)
+            HTTP_SECONDS.observe(elapsed, self.command, route)
+            HTTP_REQUESTS.inc(self.command, route, str(self.response_status or 0))
+            HTTP_REQUEST_BYTES.inc(self.command, route, amount=int(self.headers.get("Content-Length", 0) or 0))
+            HTTP_RESPONSE_BYTES.inc(self.command, route, amount=self.wfile.count - sent)
+    return handle
+
+routes = Router()
+
+def processing_admission(handler, call_next):
+    """Middleware for routes that queue processing: see admit_processing()"""
+    if handler.admit_processing():
+        call_next()
+
+def json_body(handler, call_next):
+    """Middleware: parse the request body as a JSON object and pass it as `body`"""
+    ok, data = handler.read_json()
+    if not ok:
+        return
+    if not isinstance(data, dict):
+        handler.send_json(400, {"error": "Expected a JSON object"})
+        return
+    call_next(body=data)
 
 class DocumentProcessorHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
+    # HTTP/1.1 keeps connections alive between requests, so every response
+    # must carry a Content-Length. Idle keep-alive connections are closed
+    # after `timeout` seconds so they don't pin a worker forever.
+    protocol_version = "HTTP/1.1"
+    timeout = 30
+    # Headers and body go out in separate writes; with Nagle's algorithm the
+    # body then waits for the client's delayed ACK (~40 ms per response)
+    disable_nagle_algorithm = True
+    # Set per request by instrumented(); send_response() may also run outside it, e.g. for a malformed request line
+    response_started = None
+
+    def setup(self):
+        super().setup()
+        self.wfile = CountingWriter(self.wfile)
+
+    def send_response(self, code, message=None):
+        self.response_status = code
+        if self.response_started is None:
+            self.response_started = time.perf_counter()
+        super().send_response(code, message)
+
+    def send_json(self, status, payload, headers=None):
+        body, encoding_headers = encode_response(payload, self.headers.get("Accept-Encoding"))
+        encoding_headers.update(headers or {})
+        self.send_bytes(status, body, "application/json", encoding_headers)
+
+    def send_list(self, status, response):
+        """Send a {"items": [...], ...} response
+
+        Large lists are serialized and compressed item by item and written
+        with chunked transfer encoding, so the whole body is never built in
+        memory at once.
+        """
+        items = response["items"]
+        if len(items) < STREAM_MIN_ITEMS or self.request_version != "HTTP/1.1":
+            self.send_json(status, response)
+            return
+        meta = {k: v for k, v in response.items() if k != "items"}
+        self.send_stream(status, iter_list_json(items, meta), "application/json")
+
+    def send_stream(self, status, chunks, content_type, headers=None):
+        """Send a body produced piece by piece, compressed if the client accepts it
+
+        HTTP/1.1 clients get chunked transfer encoding; for HTTP/1.0 the
+        body runs until the connection closes. Either way only about one
+        CHUNK_SIZE write is held in memory at a time.
+        """
+        encoding = negotiate(self.headers.get("Accept-Encoding"))
+        if encoding:
+            chunks = iter_compressed(chunks, encoding)
+        chunked = self.request_version == "HTTP/1.1"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.send_header("Vary", "Accept-Encoding")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if chunked:
+            write_chunked(self.wfile, coalesce(chunks))
+        else:
+            for chunk in coalesce(chunks):
+                self.wfile.write(chunk)
+
+    def send_bytes(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_cached(self, entry):
+        """Send a pre-encoded (body, etag) entry, or 304 if the client already has it"""
+        body, etag = entry
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+        if etag_matches(self.headers.get("If-None-Match"), etag):
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+        else:
+            self.send_bytes(200, body, "application/json", headers)
+
+    def client_key(self):
+        return client_key(self.headers, self.client_address[0])
+
+    def admit(self, budget):
+        """Charge the request to the client's `budget`; answers 429 and returns False once it is spent"""
+        wait = limiters[budget].acquire(self.client_key())
+        if not wait:
+            return True
+        HTTP_REFUSED.inc(budget + "_rate_limit")
+        self.send_refusal(429, f"Rate limit exceeded for {budget} requests", wait)
+        return False
+
+    def admit_processing(self):
+        """Admission for work that queues processing: 503 while overloaded, else the client's processing budget"""
+        reason = load_shedder.overloaded()
+        if reason is not None:
+            HTTP_REFUSED.inc("overloaded_" + reason)
+            self.send_refusal(503, "Server is busy, try again later", SHED_RETRY_AFTER)
+            return False
+        return self.admit("processing")
+
+    def send_refusal(self, status, message, retry_after):
+        retry_after = max(1, math.ceil(retry_after))
+        headers = self.discard_body()
+        headers["Retry-After"] = str(retry_after)
+        self.send_json(status, {"error": message, "retryAfter": retry_after}, headers)
+
+    def send_queue_full(self, error):
+        self.send_json(503, {"error": str(error)}, {"Retry-After": str(SHED_RETRY_AFTER)})
+
+    def store_and_enqueue(self, document):
+        """Store a new document and queue its processing
+
+        Returns the document as stored now (already completed on a cache
+        hit), or None after replying 503 because the queue is full.
+        """
+        documents.put(document)
+        try:
+            enqueue_processing(document)
+        except QueueFull as e:
+            documents.delete(document["id"])
+            remove_stored_file(document)
+            self.send_queue_full(e)
+            return None
+        return documents.get(document["id"], document)
+
+    @instrumented
+    def dispatch(self):
+        """Route the request through the route table; 404/405 are answered here"""
         parsed_path = urlparse(self.path)
         path = parsed_path.path
-        query_params = parse_qs(parsed_path.query)
-        
-        # Get document types
-        if path == "/api/config/document-types":
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps(document_types).encode())
+        self.query_params = parse_qs(parsed_path.query, keep_blank_values=True)
+        # Catch up with other server processes' writes, so a client sees its
+        # own acknowledged write whichever process it lands on next
+        documents.sync()
+        route, params, allowed = routes.resolve(self.command, path)
+        if route is not None:
+            self.route_label = route.pattern
+            if route.pattern in UNLIMITED_ROUTES or self.admit("api"):
+                route(self, params)
             return
-        
-        # Get specific document type
-        if path.startswith("/api/config/document-types/"):
-            type_id = path.split("/")[-1]
-            doc_type = next((dt for dt in document_types if dt["id"] == type_id), None)
-            if doc_type:
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps(doc_type).encode())
-            else:
-                self.send_response(404)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Document type not found"}).encode())
+        headers = self.discard_body()
+        if allowed:
+            headers["Allow"] = ", ".join(allowed)
+            self.send_json(405, {"error": "Method not allowed"}, headers)
+            return
+        # Serve static files (app.html, the spec PDF, etc.)
+        if self.command == "GET" and not path.startswith("/api/") and static_files.serve(self, path):
+            self.route_label = "static"
             return
+        self.send_json(404, {"error": "Not found"}, headers)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = dispatch
+
+    def read_json(self):
+        """Read and parse a JSON body; returns (True, data), or (False, None) after replying 413/400"""
+        body = self.read_body()
+        if body is None:
+            return False, None
+        try:
+            return True, json.loads(body) if body else {}
+        except ValueError:
+            self.send_json(400, {"error": "Invalid JSON body"})
+            return False, None
+
+    @routes.route("GET", "/api/config/document-types")
+    def list_document_types(self):
+        self.send_cached(document_type_cache.list_entry())
+
+    @routes.route("GET", "/api/config/document-types/{type_id}")
+    def read_document_type(self, type_id):
+        entry = document_type_cache.entry(type_id)
+        if entry:
+            self.send_cached(entry)
+        else:
+            self.send_json(404, {"error": "Document type not found"})
+
+    def refuse_shared_type_change(self):
+        """Answer 409 and return True when several processes serve this store
+
+        Document types live in each process's memory, so a change made in
+        one worker would be invisible to the others.
+        """
+        if worker_count > 1:
+            self.send_json(409, {"error": "Document types can't be changed while several server processes are running"})
+            return True
+        return False
+
+    @routes.route("POST", "/api/config/document-types", [json_body])
+    def create_document_type(self, body):
+        if self.refuse_shared_type_change():
+            return
+        error = validate_document_type(body)
+        if error:
+            self.send_json(400, {"error": error})
+            return
+        if get_document_type(body["id"]):
+            self.send_json(409, {"error": "Document type already exists"})
+            return
+        body.setdefault("validationRules", [])
+        document_type_cache.put(body)
+        encoded, etag = document_type_cache.entry(body["id"])
+        self.send_bytes(201, encoded, "application/json", {"ETag": etag})
+
+    @routes.route("PUT", "/api/config/document-types/{type_id}", [json_body])
+    def replace_document_type(self, type_id, body):
+        if self.refuse_shared_type_change():
+            return
+        if not get_document_type(type_id):
+            self.send_json(404, {"error": "Document type not found"})
+            return
+        body["id"] = type_id  # Preserve ID
+        error = validate_document_type(body)
+        if error:
+            self.send_json(400, {"error": error})
+            return
+        body.setdefault("validationRules", [])
+        document_type_cache.put(body)
+        encoded, etag = document_type_cache.entry(type_id)
+        self.send_bytes(200, encoded, "application/json", {"ETag": etag})
+
+    def page_params(self):
+        """(page, pageSize) from the query, or None after answering 400 for values that aren't positive integers"""
+        try:
+            return (query_number(self.query_params, "page", 1, int, 1),
+                    query_number(self.query_params, "pageSize", 20, int, 1))
+        except ValueError:
+            self.send_json(400, {"error": "page and pageSize must be positive integers"})
+            return None
+
+    @routes.route("GET", "/api/documents")
+    def list_documents(self):
+        query_params = self.query_params
+        filters = {
+            "status": query_params.get("status", [None])[0] or None,
+            "reviewStatus": query_params.get("reviewStatus", [None])[0] or None,
+            "documentTypeId": query_params.get("documentTypeId", [None])[0] or None,
+        }
+        search = query_params.get("search", [""])[0]
+        paging = self.page_params()
+        if paging is None:
+            return
+        page, page_size = paging
         
-        # Get document list
-        if path == "/api/documents":
-            status = query_params.get("status", [None])[0]
-            review_status = query_params.get("reviewStatus", [None])[0]
-            search = query_params.get("search", [""])[0]
-            page = int(query_params.get("page", [1])[0])
-            page_size = int(query_params.get("pageSize", [20])[0])
-            
-            items = list(documents.values())
-            
-            if status:
-                items = [d for d in items if d["status"] == status]
-            if review_status:
-                items = [d for d in items if d["reviewStatus"] == review_status]
+        # Cursor (keyset) pagination: pass cursor= (empty) for the first page,
+        # then the nextCursor of the previous response
+        if "cursor" in query_params:
             if search:
-                search_lower = search.lower()
-                items = [d for d in items if 
-                        search_lower in d["fileName"].lower() or
-                        search_lower in d["ocrText"].lower() or
-                        search_lower in json.dumps(d["extractedData"]).lower()]
-            
-            start = (page - 1) * page_size
-            end = start + page_size
-            paginated = items[start:end]
-            
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
+                self.send_json(400, {"error": "Cursor pagination is not supported with search"})
+                return
+            cursor = query_params["cursor"][0]
+            try:
+                after = decode_cursor(cursor) if cursor else None
+            except ValueError as e:
+                self.send_json(400, {"error": str(e)})
+                return
+            descending = query_params.get("sortOrder", ["asc"])[0] == "desc"
+            with_total = query_params.get("includeTotal", ["false"])[0] == "true"
+            paginated, next_key, total = documents.page_after(
+                filters, after, page_size, descending=descending, with_total=with_total)
             response = {
-                "items": paginated,
-                "total": len(items),
-                "page": page,
+                "items": projection.from_query(query_params, "summary").apply_all(paginated),
+                "nextCursor": encode_cursor(next_key) if next_key else None,
                 "pageSize": page_size
             }
-            self.wfile.write(json.dumps(response).encode())
+            if total is not None:
+                response["total"] = total
+            self.send_list(200, response)
             return
         
-        # Get single document
-        if path.startswith("/api/documents/") and not any(x in path for x in ["/approve", "/reject", "/reprocess", "/search"]):
-            doc_id = path.split("/")[-1]
-            if doc_id in documents:
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps(documents[doc_id]).encode())
-            else:
-                self.send_response(404)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Document not found"}).encode())
-            return
+        if search:
+            paginated, total = documents.search(search, filters, (page - 1) * page_size, page_size)
+        else:
+            paginated, total = documents.query(filters, (page - 1) * page_size, page_size)
         
-        # Health check
-        if path == "/api/health":
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({"status": "ok", "message": "API server is running"}).encode())
+        response = {
+            "items": projection.from_query(query_params, "summary").apply_all(paginated),
+            "total": total,
+            "page": page,
+            "pageSize": page_size
+        }
+        self.send_list(200, response)
+
+    @routes.route("GET", "/api/documents/search")
+    def search_documents(self):
+        """Full-text search, ranked by relevance"""
+        query_params = self.query_params
+        search = query_params.get("q", query_params.get("search", [""]))[0]
+        filters = {
+            "status": query_params.get("status", [None])[0] or None,
+            "reviewStatus": query_params.get("reviewStatus", [None])[0] or None,
+            "documentTypeId": query_params.get("documentTypeId", [None])[0] or None,
+        }
+        paging = self.page_params()
+        if paging is None:
             return
+        page, page_size = paging
         
-        # Serve static files (app.html, etc.)
-        if path == "/" or path == "/app.html":
-            try:
-                with open("app.html", "rb") as f:
-                    content = f.read()
-                self.send_response(200)
-                self.send_header("Content-Type", "text/html")
-                self.end_headers()
-                self.wfile.write(content)
-                return
-            except FileNotFoundError:
-                pass
+        paginated, total = documents.search(search, filters, (page - 1) * page_size, page_size)
         
+        response = {
+            "items": projection.from_query(query_params, "summary").apply_all(paginated),
+            "total": total,
+            "page": page,
+            "pageSize": page_size
+        }
+        self.send_list(200, response)
+
+    @routes.route("GET", "/api/documents/export")
+    def export_documents(self):
+        """Every matching document, oldest first, as NDJSON (format=ndjson, the default) or CSV
+
+        NDJSON lines take the same fields/exclude/view parameters as single
+        documents. CSV needs a documentTypeId, whose extraction template
+        fields become the columns after export.CSV_COLUMNS. Documents are
+        read in index batches and serialized as they are written, so
+        memory use doesn't depend on how many match.
+        """
+        query_params = self.query_params
+        filters = {
+            "status": query_params.get("status", [None])[0] or None,
+            "reviewStatus": query_params.get("reviewStatus", [None])[0] or None,
+            "documentTypeId": query_params.get("documentTypeId", [None])[0] or None,
+        }
+        export_format = query_params.get("format", ["ndjson"])[0]
+        if export_format == "ndjson":
+            chunks = iter_ndjson(documents.scan(filters), projection.from_query(query_params))
+        elif export_format == "csv":
+            doc_type = get_document_type(filters["documentTypeId"]) if filters["documentTypeId"] else None
+            if doc_type is None:
+                self.send_json(400, {"error": "CSV export needs a valid documentTypeId"})
+                return
+            chunks = iter_csv(documents.scan(filters), doc_type)
+        else:
+            self.send_json(400, {"error": "format must be ndjson or csv"})
+            return
+        headers = {
+            "Content-Disposition": f'attachment; filename="documents.{export_format}"',
+            "Cache-Control": "no-store",
+        }
+        try:
+            self.send_stream(200, chunks, EXPORT_CONTENT_TYPES[export_format], headers)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    @routes.route("GET", "/api/documents/changes")
+    def get_changes(self):
+        """Changes after `since`, long-polling up to `wait` seconds when there are none yet
+
+        Without `since` this only returns the current sequence number to start from.
+        """
+        try:
+            since, ids = change_feed_params(self.query_params, self.headers)
+            wait = min(query_number(self.query_params, "wait", 0, float, 0), MAX_STATUS_WAIT)
+            limit = min(query_number(self.query_params, "limit", 1000, int, 1), 1000)
+        except ValueError:
+            self.send_json(400, {"error": "since must be a number, wait a number of seconds and limit a positive integer"})
+            return
+        if wait > 0 and since is not None:
+            events, cursor, reset = change_feed.wait(since, wait, limit, ids)
+        else:
+            events, cursor, reset = change_feed.since(since, limit, ids)
+        self.send_json(200, {"events": events, "seq": cursor, "reset": reset}, {"Cache-Control": "no-store"})
+
+    @routes.route("GET", "/api/documents/changes/stream")
+    def stream_changes(self):
+        """Server-sent events: one "change" event per diff, with its sequence number as the event id
+
+        A "reset" event means the requested position is no longer available
+        and the client should refetch before following the stream.
+        """
+        try:
+            since, ids = change_feed_params(self.query_params, self.headers)
+        except ValueError:
+            self.send_json(400, {"error": "since must be a number"})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-store")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        with change_feed.subscription():
+            try:
+                write_chunked(self.wfile, self.iter_change_events(since, ids))
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+
+    def iter_change_events(self, since, ids):
+        cursor = change_feed.latest if since is None else since
+        # Every message carries an id, so a reconnect resumes from here even if no change was sent yet
+        yield b"retry: 3000\nid: %d\n\n" % cursor
+        deadline = time.monotonic() + MAX_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            events, cursor, reset = change_feed.wait(cursor, STREAM_HEARTBEAT, ids=ids)
+            yield sse_message(events, cursor, reset)
+
+    @routes.route("GET", "/api/documents/{doc_id}/status")
+    def get_processing_status(self, doc_id):
+        """Processing status, optionally long-polling until the job finishes"""
+        try:
+            wait = min(query_number(self.query_params, "wait", 0, float, 0), MAX_STATUS_WAIT)
+        except ValueError:
+            self.send_json(400, {"error": "wait must be a number of seconds"})
+            return
+        job = job_queue.wait(doc_id, wait) if wait > 0 else job_queue.get(doc_id)
+        doc = documents.get(doc_id)
+        if doc is not None:
+            self.send_json(200, {
+                "documentId": doc_id,
+                "status": doc["status"],
+                "job": job.to_dict() if job else None,
+                "queueDepth": job_queue.depth
+            })
+        else:
+            self.send_json(404, {"error": "Document not found"})
+
+    @routes.route("GET", "/api/documents/{doc_id}")
+    def get_document(self, doc_id):
+        doc = documents.get(doc_id)
+        if doc is None:
+            self.send_json(404, {"error": "Document not found"})
+            return
+        etag = document_etag(doc)
+        if etag_matches(self.headers.get("If-None-Match"), etag):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_json(200, projection.from_query(self.query_params).apply(doc), {"ETag": etag})
+
+    @routes.route("GET", "/api/metrics")
+    def get_metrics(self):
+        self.send_bytes(200, registry.render(), METRICS_CONTENT_TYPE, {"Cache-Control": "no-store"})
+
+    @routes.route("GET", "/api/health")
+    def health(self):
+        self.send_json(200, {
+            "status": "ok",
+            "message": "API server is running",
+            "extractionCache": extraction_cache.stats(),
+        })
+
+    @instrumented
+    def do_HEAD(self):
+        path = urlparse(self.path).path
+        if not path.startswith("/api/") and static_files.serve(self, path):
+            self.route_label = "static"
+            return
         self.send_response(404)
-        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "0")
         self.end_headers()
-        self.wfile.write(json.dumps({"error": "Not found"}).encode())
 
-    def do_POST(self):
+    def discard_body(self):
+        """Skip an unwanted request body so the connection can be reused
+
+        Returns headers for the response: a body too large to be worth
+        reading (or chunked) means closing the connection instead.
+        """
+        content_length = int(self.headers.get("Content-Length", 0) or 0)
+        if self.headers.get("Transfer-Encoding") or content_length > MAX_JSON_BODY:
+            self.close_connection = True
+            return {"Connection": "close"}
+        if content_length:
+            self.rfile.read(content_length)
+        return {}
+
+    def read_body(self):
+        """Read a JSON-sized request body; returns None after sending 413 if it is too large"""
         content_length = int(self.headers.get("Content-Length", 0))
-        body = self.rfile.read(content_length)
-        parsed_path = urlparse(self.path)
-        path = parsed_path.path
+        if content_length > MAX_JSON_BODY:
+            self.close_connection = True
+            self.send_json(413, {"error": "Request body too large"})
+            return None
+        return self.rfile.read(content_length)
+
+    def receive_upload(self, query_params):
+        """Spool a multipart/form-data or raw binary body to UPLOAD_DIR
+
+        Files are written in fixed-size chunks while their size and SHA-256
+        are computed, so memory use doesn't grow with file size. For raw
+        uploads, documentTypeId/fileName come from the query string (or the
+        X-File-Name header). Returns (fields, files), or None after replying 400.
+        """
+        content_type, params = parse_header_params(self.headers.get("Content-Type", "application/octet-stream"))
+        reader = BodyReader(
+            self.rfile,
+            int(self.headers.get("Content-Length", 0) or 0),
+            chunked="chunked" in self.headers.get("Transfer-Encoding", "").lower(),
+        )
+        fields = {k: v[0] for k, v in query_params.items()}
+        try:
+            if content_type == "multipart/form-data":
+                if "boundary" not in params:
+                    raise UploadError("Multipart boundary is missing")
+                form_fields, files = spool_multipart(reader, params["boundary"], UPLOAD_DIR)
+                fields.update(form_fields)
+            else:
+                file_name = fields.get("fileName") or self.headers.get("X-File-Name", "document")
+                files = [spool_raw(reader, UPLOAD_DIR, file_name, content_type)]
+        except UploadError as e:
+            # The rest of the body is unread, so the connection can't be reused
+            self.close_connection = True
+            self.send_json(400, {"error": str(e)})
+            return None
+        return fields, files
+
+    def handle_upload_stream(self, query_params):
+        """Upload a single file streamed as multipart/form-data or raw binary"""
+        received = self.receive_upload(query_params)
+        if received is None:
+            return
+        fields, files = received
+        upload = next((f for f in files if f.field_name == "file"), files[0] if files else None)
+        for extra in files:
+            if extra is not upload:
+                extra.discard()
+        doc_type_id = fields.get("documentTypeId")
+        doc_type = get_document_type(doc_type_id)
+        if upload is None or not doc_type:
+            if upload is not None:
+                upload.discard()
+            error = "A file is required" if upload is None else (
+                "Document type is required" if not doc_type_id else "Invalid document type")
+            self.send_json(400, {"error": error})
+            return
         
-        # Upload document
-        if path == "/api/documents/upload":
+        document = self.store_and_enqueue(document_from_upload(doc_type, upload, fields.get("fileName")))
+        if document is not None:
+            self.send_json(200, document)
+
+    def send_batch_results(self, results):
+        succeeded = sum(1 for r in results if r["success"])
+        self.send_json(200, {
+            "results": results,
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded
+        })
+
+    def enqueue_batch(self, entries):
+        """Store new documents in one pass and queue them; returns per-item results"""
+        documents.put_many(entries)
+        results = []
+        for index, document in enumerate(entries):
             try:
-                data = json.loads(body)
-                doc_type_id = data.get("documentTypeId")
-                file_name = data.get("fileName", "document.pdf")
-                
-                if not doc_type_id:
-                    self.send_response(400)
-                    self.send_header("Content-Type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(json.dumps({"error": "Document type is required"}).encode())
-                    return
-                
-                doc_type = next((dt for dt in document_types if dt["id"] == doc_type_id), None)
-                if not doc_type:
-                    self.send_response(400)
-                    self.send_header("Content-Type", "application/json")
-                    self.end_headers()
-                    self.wfile.write(json.dumps({"error": "Invalid document type"}).encode())
-                    return
-                
-                doc_id = f"DOC-{str(uuid.uuid4())[:8].upper()}"
-                ocr_text = f"Sample OCR text extracted from {file_name}"
-                extracted_data = simulate_ai_processing(doc_type_id, ocr_text)
-                
-                import random
-                document = {
-                    "id": doc_id,
-                    "fileName": file_name,
-                    "fileType": "application/pdf",
-                    "fileSize": random.randint(100000, 5000000),
-                    "uploadedAt": datetime.now().isoformat(),
-                    "documentTypeId": doc_type_id,
-                    "status": "completed",
-                    "extractedData": extracted_data,
-                    "ocrText": ocr_text,
-                    "confidence": 0.85 + random.random() * 0.15,
-                    "processingErrors": [],
-                    "metadata": {
-                        "pageCount": 1,
-                        "language": "en",
-                        "classification": {
-                            "type": doc_type["name"],
-                            "confidence": 0.92
-                        },
-                        "entities": []
-                    },
-                    "reviewStatus": "pending",
-                    "comments": ""
-                }
-                
-                documents[doc_id] = document
-                
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps(document).encode())
-            except Exception as e:
-                self.send_response(500)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": str(e)}).encode())
+                enqueue_processing(document)
+            except QueueFull as e:
+                documents.delete(document["id"])
+                remove_stored_file(document)
+                results.append({"index": index, "id": None, "success": False, "status": 503, "error": str(e)})
+                continue
+            results.append({"index": index, "id": document["id"], "success": True, "status": 200,
+                            "document": documents.get(document["id"], document)})
+        return results
+
+    def handle_batch_upload_stream(self, query_params):
+        """Upload several files in one multipart body, all of the same documentTypeId"""
+        received = self.receive_upload(query_params)
+        if received is None:
+            return
+        fields, files = received
+        doc_type = get_document_type(fields.get("documentTypeId"))
+        error = None
+        if not files:
+            error = "At least one file is required"
+        elif len(files) > MAX_BATCH:
+            error = f"A batch may contain at most {MAX_BATCH} files"
+        elif not doc_type:
+            error = "Document type is required" if not fields.get("documentTypeId") else "Invalid document type"
+        if error:
+            for upload in files:
+                upload.discard()
+            self.send_json(400, {"error": error})
             return
         
-        # Approve document
-        if "/approve" in path:
-            doc_id = path.split("/")[-2]
-            if doc_id in documents:
-                data = json.loads(body) if body else {}
-                documents[doc_id]["reviewStatus"] = "approved"
-                documents[doc_id]["reviewedAt"] = datetime.now().isoformat()
-                documents[doc_id]["reviewedBy"] = "Current User"
-                documents[doc_id]["comments"] = data.get("comments", "")
-                
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps(documents[doc_id]).encode())
-            else:
-                self.send_response(404)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Document not found"}).encode())
+        entries = [document_from_upload(doc_type, upload) for upload in files]
+        self.send_batch_results(self.enqueue_batch(entries))
+
+    def handle_batch(self, action, data):
+        """Bulk upload/approve/reject/reprocess/validate/delete with per-item results
+
+        Review actions take {"items": [{"id": ..., "comments": ...}]} or
+        {"ids": [...], "comments": ...}; uploads take {"documents": [...]}
+        with the same fields as a single JSON upload. validate re-checks
+        stored extractedData, or applies and checks the edits given as
+        {"items": [{"id": ..., "extractedData": {...}}]}, and writes the
+        errors to processingErrors. A bare JSON array is taken as the item
+        list.
+        """
+        if isinstance(data, list):
+            data = {"documents" if action == "upload" else "items": data}
+        if action == "upload":
+            items = data.get("documents", [])
+        elif data.get("items"):
+            items = data["items"]
+        else:
+            ids = data.get("ids", [])
+            items = [{"id": doc_id} for doc_id in ids] if isinstance(ids, list) else None
+        if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+            self.send_json(400, {"error": "Expected a non-empty list of objects"})
+            return
+        if len(items) > MAX_BATCH:
+            self.send_json(413, {"error": f"A batch may contain at most {MAX_BATCH} items"})
             return
         
-        # Reject document
-        if "/reject" in path:
-            doc_id = path.split("/")[-2]
-            if doc_id in documents:
-                data = json.loads(body) if body else {}
-                documents[doc_id]["reviewStatus"] = "rejected"
-                documents[doc_id]["reviewedAt"] = datetime.now().isoformat()
-                documents[doc_id]["reviewedBy"] = "Current User"
-                documents[doc_id]["comments"] = data.get("comments", "")
-                documents[doc_id]["status"] = "needs-review"
-                
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps(documents[doc_id]).encode())
-            else:
-                self.send_response(404)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Document not found"}).encode())
+        if action == "upload":
+            results = [None] * len(items)
+            entries = []
+            positions = []
+            for index, item in enumerate(items):
+                doc_type = get_document_type(item.get("documentTypeId"))
+                if not doc_type:
+                    results[index] = {"index": index, "id": None, "success": False, "status": 400,
+                                      "error": "Invalid document type" if item.get("documentTypeId") else "Document type is required"}
+                    continue
+                entries.append(create_document(doc_type, item.get("fileName", "document.pdf")))
+                positions.append(index)
+            for index, result in zip(positions, self.enqueue_batch(entries)):
+                result["index"] = index
+                results[index] = result
+            self.send_batch_results(results)
             return
         
-        # Reprocess document
-        if "/reprocess" in path:
-            doc_id = path.split("/")[-2]
-            if doc_id in documents:
-                doc = documents[doc_id]
-                extracted_data = simulate_ai_processing(doc["documentTypeId"], doc["ocrText"])
-                
-                import random
-                doc["status"] = "completed"
-                doc["extractedData"] = extracted_data
-                doc["confidence"] = 0.85 + random.random() * 0.15
-                doc["processingErrors"] = []
-                
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                result = {
-                    "documentId": doc_id,
-                    "status": "success",
-                    "extractedData": extracted_data,
-                    "ocrText": doc["ocrText"],
-                    "confidence": doc["confidence"]
+        ids = [item.get("id") for item in items]
+        # Items whose id isn't a string fail on their own (400) instead of failing the batch
+        valid_items = [item for item in items if isinstance(item.get("id"), str)]
+        valid_ids = [item["id"] for item in valid_items]
+        if action == "delete":
+            stored = {doc_id: documents.get(doc_id) for doc_id in valid_ids}
+            deleted = documents.delete_many(valid_ids)
+            for doc_id, was_deleted in deleted.items():
+                if was_deleted:
+                    remove_stored_file(stored[doc_id])
+            outcomes = {doc_id: deleted[doc_id] for doc_id in valid_ids}
+        elif action in ("approve", "reject"):
+            reviewed_at = datetime.now().isoformat()
+            changes = {}
+            for item in valid_items:
+                change = {
+                    "reviewStatus": "approved" if action == "approve" else "rejected",
+                    "reviewedAt": reviewed_at,
+                    "reviewedBy": "Current User",
+                    "comments": item.get("comments", data.get("comments", "")),
                 }
-                self.wfile.write(json.dumps(result).encode())
-            else:
-                self.send_response(404)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Document not found"}).encode())
+                if action == "reject":
+                    change["status"] = "needs-review"
+                changes[item["id"]] = change
+            updated = documents.update_many(changes)
+            outcomes = {doc_id: updated[doc_id] is not None for doc_id in valid_ids}
+        elif action == "reprocess":
+            with documents.lock:
+                previous = {doc_id: documents.get(doc_id) for doc_id in valid_ids}
+                updated = documents.update_many({
+                    doc_id: mark_processing() for doc_id in valid_ids if previous[doc_id] is not None})
+            outcomes = {}
+            for doc_id, doc in updated.items():
+                try:
+                    enqueue_processing(doc)
+                    outcomes[doc_id] = True
+                except QueueFull as e:
+                    documents.update(doc_id, {"status": previous[doc_id]["status"]})
+                    outcomes[doc_id] = e
+        elif action == "validate":
+            errors_by_id = {}
+            with documents.lock:
+                pending = []
+                for item in valid_items:
+                    doc = documents.get(item["id"])
+                    doc_type = get_document_type(doc["documentTypeId"]) if doc is not None else None
+                    if doc_type is None:
+                        continue
+                    edits = item.get("extractedData")
+                    extracted = edits if isinstance(edits, dict) else doc.get("extractedData") or {}
+                    pending.append((doc["id"], doc_type, extracted, isinstance(edits, dict)))
+                errors = validators.validate_many([(doc_type, extracted) for _, doc_type, extracted, _ in pending])
+                changes = {}
+                for (doc_id, _, extracted, edited), doc_errors in zip(pending, errors):
+                    changes[doc_id] = {"processingErrors": doc_errors}
+                    if edited:
+                        changes[doc_id]["extractedData"] = extracted
+                    errors_by_id[doc_id] = doc_errors
+                updated = documents.update_many(changes)
+            outcomes = {doc_id: updated.get(doc_id) is not None for doc_id in valid_ids}
+        else:
+            self.send_json(404, {"error": "Not found"})
             return
         
-        self.send_response(404)
-        self.send_header("Content-Type", "application/json")
-        self.end_headers()
-        self.wfile.write(json.dumps({"error": "Not found"}).encode())
-
-    def do_PUT(self):
-        content_length = int(self.headers.get("Content-Length", 0))
-        body = self.rfile.read(content_length)
-        parsed_path = urlparse(self.path)
-        path = parsed_path.path
-        
-        if path.startswith("/api/documents/") and "/" not in path.split("/")[-1]:
-            doc_id = path.split("/")[-1]
-            if doc_id in documents:
-                data = json.loads(body) if body else {}
-                documents[doc_id].update(data)
-                documents[doc_id]["id"] = doc_id  # Preserve ID
-                
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps(documents[doc_id]).encode())
+        results = []
+        for index, doc_id in enumerate(ids):
+            outcome = outcomes.get(doc_id, False) if isinstance(doc_id, str) else None
+            if outcome is None:
+                results.append({"index": index, "id": None, "success": False, "status": 400, "error": "id must be a string"})
+            elif outcome is True:
+                results.append({"index": index, "id": doc_id, "success": True, "status": 200})
+                if action == "validate":
+                    results[-1]["errors"] = errors_by_id[doc_id]
+            elif isinstance(outcome, QueueFull):
+                results.append({"index": index, "id": doc_id, "success": False, "status": 503, "error": str(outcome)})
             else:
-                self.send_response(404)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Document not found"}).encode())
+                results.append({"index": index, "id": doc_id, "success": False, "status": 404, "error": "Document not found"})
+        self.send_batch_results(results)
+
+    @routes.route("POST", "/api/documents/batch/{action}")
+    def batch(self, action):
+        if action in ("upload", "reprocess") and not self.admit_processing():
             return
-        
-        self.send_response(404)
-        self.send_header("Content-Type", "application/json")
-        self.end_headers()
-        self.wfile.write(json.dumps({"error": "Not found"}).encode())
+        if action == "upload" and self.headers.get("Content-Type", "").startswith("multipart/"):
+            self.handle_batch_upload_stream(self.query_params)
+            return
+        ok, data = self.read_json()
+        if ok:
+            self.handle_batch(action, data)
 
-    def do_DELETE(self):
-        parsed_path = urlparse(self.path)
-        path = parsed_path.path
-        
-        if path.startswith("/api/documents/"):
-            doc_id = path.split("/")[-1]
-            if doc_id in documents:
-                del documents[doc_id]
-                
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps({"success": True}).encode())
-            else:
-                self.send_response(404)
-                self.send_header("Content-Type", "application/json")
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Document not found"}).encode())
+    @routes.route("POST", "/api/documents/upload", [processing_admission])
+    def upload_document(self):
+        # File uploads are streamed to disk instead of being read into memory
+        content_type = self.headers.get("Content-Type", "")
+        if content_type and not content_type.startswith("application/json"):
+            self.handle_upload_stream(self.query_params)
+            return
+        ok, data = self.read_json()
+        if not ok:
+            return
+        try:
+            doc_type_id = data.get("documentTypeId")
+            file_name = data.get("fileName", "document.pdf")
+            
+            if not doc_type_id:
+                self.send_json(400, {"error": "Document type is required"})
+                return
+            
+            doc_type = get_document_type(doc_type_id)
+            if not doc_type:
+                self.send_json(400, {"error": "Invalid document type"})
+                return
+            
+            document = create_document(doc_type, file_name)
+            document = self.store_and_enqueue(document)
+            if document is not None:
+                self.send_json(200, document)
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+
+    @routes.route("POST", "/api/documents/{doc_id}/approve", [json_body])
+    def approve_document(self, doc_id, body):
+        doc = documents.update(doc_id, {
+            "reviewStatus": "approved",
+            "reviewedAt": datetime.now().isoformat(),
+            "reviewedBy": "Current User",
+            "comments": body.get("comments", ""),
+        })
+        if doc is not None:
+            self.send_json(200, doc)
+        else:
+            self.send_json(404, {"error": "Document not found"})
+
+    @routes.route("POST", "/api/documents/{doc_id}/reject", [json_body])
+    def reject_document(self, doc_id, body):
+        doc = documents.update(doc_id, {
+            "reviewStatus": "rejected",
+            "reviewedAt": datetime.now().isoformat(),
+            "reviewedBy": "Current User",
+            "comments": body.get("comments", ""),
+            "status": "needs-review",
+        })
+        if doc is not None:
+            self.send_json(200, doc)
+        else:
+            self.send_json(404, {"error": "Document not found"})
+
+    @routes.route("POST", "/api/documents/{doc_id}/reprocess", [processing_admission, json_body])
+    def reprocess_document(self, doc_id, body):
+        previous = documents.get(doc_id)
+        if previous is None:
+            self.send_json(404, {"error": "Document not found"})
+            return
+        # Mark it before queueing so a fast worker's result isn't overwritten
+        doc = documents.update(doc_id, mark_processing())
+        try:
+            job = enqueue_processing(doc)
+        except QueueFull as e:
+            documents.update(doc_id, {"status": previous["status"]})
+            self.send_queue_full(e)
             return
         
-        self.send_response(404)
-        self.send_header("Content-Type", "application/json")
-        self.end_headers()
-        self.wfile.write(json.dumps({"error": "Not found"}).encode())
+        # Poll GET /api/documents/{id}/status?wait=N for the result
+        self.send_json(202, {
+            "documentId": doc_id,
+            "status": documents.get(doc_id, doc)["status"],
+            "job": job.to_dict()
+        })
+
+    @routes.route("PUT", "/api/documents/{doc_id}", [json_body])
+    def update_document(self, doc_id, body):
+        error = validate_document_edit(body)
+        if error:
+            self.send_json(400, {"error": error})
+            return
+        body.update(revalidate(documents.get(doc_id) or {}, body))
+        self.send_edited(doc_id, documents.update, body)  # update() preserves the ID
+
+    @routes.route("PATCH", "/api/documents/{doc_id}", [json_body])
+    def patch_document(self, doc_id, body):
+        """Apply a JSON Merge Patch, e.g. {"extractedData": {"total": "12.50"}}, to the changed fields only"""
+        error = validate_document_edit(body)
+        if error:
+            self.send_json(400, {"error": error})
+            return
+        self.send_edited(doc_id, documents.patch, body, prepare=revalidate)
+
+    def send_edited(self, doc_id, edit, body, **options):
+        """Run a document edit, conditional on If-Match; answers 200 with the new ETag, 404 or 412"""
+        try:
+            doc = edit(doc_id, body, if_match_versions(self.headers.get("If-Match")), **options)
+        except VersionConflict as e:
+            self.send_json(412, {"error": "Document was changed by someone else", "version": e.current},
+                           {"ETag": f'"{e.current}"'})
+            return
+        if doc is not None:
+            self.send_json(200, doc, {"ETag": document_etag(doc)})
+        else:
+            self.send_json(404, {"error": "Document not found"})
+
+    @routes.route("DELETE", "/api/documents/{doc_id}")
+    def delete_document(self, doc_id):
+        doc = documents.get(doc_id)
+        if documents.delete(doc_id):
+            remove_stored_file(doc)
+            self.send_json(200, {"success": True})
+        else:
+            self.send_json(404, {"error": "Document not found"})
 
     def end_headers(self):
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Methods", "GET, POST, PUT, DELETE, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        for name, value in CORS_HEADERS:
+            self.send_header(name, value)
         super().end_headers()
 
+    @instrumented
     def do_OPTIONS(self):
+        self.route_label = "preflight"
         self.send_response(200)
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.send_header("Access-Control-Allow-Methods", "GET, POST, PUT, DELETE, OPTIONS")
-        self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        self.send_header("Content-Length", "0")
         self.end_headers()
 
     def log_message(self, format, *args):
-        print(f"[{self.log_date_time_string()}] {format % args}")
+        if access_log is not None:
+            access_log.write(f"[{self.log_date_time_string()}] {format % args}")
+
+class ThreadedHTTPServer(ThreadingHTTPServer):
+    """Spawns one thread per connection"""
+    daemon_threads = True
+
+    def __init__(self, server_address, handler_class, backlog=128, reuse_port=False):
+        self.request_queue_size = backlog
+        self.allow_reuse_port = reuse_port
+        super().__init__(server_address, handler_class)
+
+
+class WorkerPoolHTTPServer(HTTPServer):
+    """Hands accepted connections to a fixed pool of pre-started worker threads
+
+    The document store lives in this process, so workers are threads rather
+    than forked processes; forked children would each get a private copy.
+    """
+
+    def __init__(self, server_address, handler_class, workers=16, backlog=128, reuse_port=False):
+        self.request_queue_size = backlog
+        self.allow_reuse_port = reuse_port
+        self._connections = queue.Queue()
+        super().__init__(server_address, handler_class)
+        self._workers = [
+            threading.Thread(target=self._work, name=f"http-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _work(self):
+        while True:
+            item = self._connections.get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def process_request(self, request, client_address):
+        self._connections.put((request, client_address))
+
+    def server_close(self):
+        super().server_close()
+        for _ in self._workers:
+            self._connections.put(None)
+
+
+class SingleThreadedHTTPServer(HTTPServer):
+    """Handles one connection at a time (the original behaviour)"""
+
+    def __init__(self, server_address, handler_class, backlog=128, reuse_port=False):
+        self.request_queue_size = backlog
+        self.allow_reuse_port = reuse_port
+        super().__init__(server_address, handler_class)
+
+
+# In asyncio mode, long-polls and change streams wait on the event loop
+# rather than holding a handler thread, so idle clients cost no threads.
+
+async def _await_changes(engine, request, params):
+    """Hold a changes long-poll until it has something to return, then let the handler answer at once"""
+    query = parse_qs(request.query, keep_blank_values=True)
+    try:
+        since, ids = change_feed_params(query, request.headers)
+        wait = min(query_number(query, "wait", 0, float, 0), MAX_STATUS_WAIT)
+    except ValueError:
+        return None  # the handler answers 400
+    if since is not None and wait > 0:
+        deadline = time.monotonic() + wait
+        cursor = since
+        while True:
+            events, cursor, reset = change_feed.since(cursor, 1, ids)
+            remaining = deadline - time.monotonic()
+            if events or reset or remaining <= 0:
+                break
+            await engine.changed(remaining)
+    request.set_query(wait=None)
+    return None
+
+async def _await_job(engine, request, params):
+    """Hold a status long-poll until the job finishes, then let the handler answer at once"""
+    query = parse_qs(request.query, keep_blank_values=True)
+    try:
+        wait = min(query_number(query, "wait", 0, float, 0), MAX_STATUS_WAIT)
+    except ValueError:
+        return None
+    deadline = time.monotonic() + wait
+    while True:
+        job = job_queue.get(params["doc_id"])
+        remaining = deadline - time.monotonic()
+        if job is None or job.finished or remaining <= 0:
+            break
+        await engine.changed(remaining)
+    request.set_query(wait=None)
+    return None
+
+async def _stream_changes(engine, request, params):
+    """The change stream served from the event loop (see stream_changes)
+
+    Admitted and synced like a request through dispatch(): charged to the
+    client's api budget, after catching up with other processes' writes.
+    """
+    try:
+        since, ids = change_feed_params(parse_qs(request.query, keep_blank_values=True), request.headers)
+    except ValueError:
+        return None
+    writer = request.writer
+    peer = writer.get_extra_info("peername")
+    wait = limiters["api"].acquire(client_key(request.headers, peer[0] if peer else ""))
+    if wait:
+        HTTP_REFUSED.inc("api_rate_limit")
+        HTTP_REQUESTS.inc("GET", "/api/documents/changes/stream", "429")
+        await engine.send_error(writer, 429, "Rate limit exceeded for api requests",
+                                {"Retry-After": str(max(1, math.ceil(wait))), **dict(CORS_HEADERS)})
+        return True
+    # sync() may wait on the store lock and queries the database: keep it off the loop
+    await asyncio.get_running_loop().run_in_executor(engine.executor, documents.sync)
+    started = time.perf_counter()
+    HTTP_IN_FLIGHT.inc("GET")
+    cursor = change_feed.latest if since is None else since
+    try:
+        with change_feed.subscription():
+            await engine.send_stream_head(writer, 200, (
+                ("Content-Type", "text/event-stream"), ("Cache-Control", "no-store"), *CORS_HEADERS))
+            await engine.send_chunk(writer, b"retry: 3000\nid: %d\n\n" % cursor)
+            deadline = time.monotonic() + MAX_STREAM_SECONDS
+            last_sent = time.monotonic()
+            while time.monotonic() < deadline:
+                events, cursor, reset = change_feed.since(cursor, 1000, ids)
+                idle = time.monotonic() - last_sent
+                if events or reset or idle >= STREAM_HEARTBEAT:
+                    await engine.send_chunk(writer, sse_message(events, cursor, reset))
+                    last_sent = time.monotonic()
+                    continue
+                await engine.changed(min(STREAM_HEARTBEAT - idle, deadline - time.monotonic()))
+            await engine.send_chunk(writer, b"")
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        HTTP_IN_FLIGHT.dec("GET")
+        HTTP_SECONDS.observe(time.perf_counter() - started, "GET", "/api/documents/changes/stream")
+        HTTP_REQUESTS.inc("GET", "/api/documents/changes/stream", "200")
+    return True
+
+ASYNC_HOOKS = {
+    "/api/documents/changes": _await_changes,
+    "/api/documents/changes/stream": _stream_changes,
+    "/api/documents/{doc_id}/status": _await_job,
+}
+
+
+def make_server(host, port, mode="threaded", workers=16, backlog=128,
+                max_connections=10000, request_timeout=30.0, idle_timeout=75.0, reuse_port=False):
+    """Build an HTTP server for DocumentProcessorHandler in the given concurrency mode
+
+    max_connections, request_timeout and idle_timeout apply to the asyncio
+    mode. `reuse_port` binds with SO_REUSEPORT, so several processes can
+    listen on the same port.
+    """
+    address = (host, port)
+    if mode == "asyncio":
+        server = AsyncHTTPServer(
+            address, DocumentProcessorHandler, workers=workers, backlog=max(backlog, 1024),
+            max_connections=max_connections, request_timeout=request_timeout, idle_timeout=idle_timeout,
+            router=routes, hooks=ASYNC_HOOKS, reuse_port=reuse_port,
+        )
+        change_feed.add_watcher(server.notify)
+        job_queue.add_listener(lambda job: server.notify())
+        return server
+    if mode == "threaded":
+        return ThreadedHTTPServer(address, DocumentProcessorHandler, backlog=backlog, reuse_port=reuse_port)
+    if mode == "pool":
+        return WorkerPoolHTTPServer(address, DocumentProcessorHandler, workers=workers, backlog=backlog,
+                                    reuse_port=reuse_port)
+    if mode == "single":
+        return SingleThreadedHTTPServer(address, DocumentProcessorHandler, backlog=backlog, reuse_port=reuse_port)
+    raise ValueError(f"Unknown server mode: {mode}")
+
+
+def run_workers(argv, processes):
+    """Run `processes` copies of this server on one port until they exit; returns their exit status
+
+    Each worker binds the port with SO_REUSEPORT, so the kernel spreads
+    connections across them, and they share the SQLite document store.
+    The job queue, caches and metrics stay per process; document types
+    are read-only while several processes run. A worker that dies is restarted; SIGINT or SIGTERM stops them all.
+    """
+    script = os.path.abspath(__file__)
+
+    def spawn(index):
+        # Change feed numbers interleave: worker i hands out start + k * processes,
+        # with start = i (mod processes). Like a restarted server, a restarted
+        # worker starts from the current time, ahead of the numbers its
+        # predecessor handed out, so clients resuming from those get a reset
+        now = time.time_ns() // 1000
+        start = now - now % processes + index
+        return subprocess.Popen([sys.executable, script, *argv,
+                                 "--worker-index", str(index), "--feed-start", str(start)])
+
+    children = [spawn(i) for i in range(processes)]
+    stopping = threading.Event()
+
+    def stop(signum=None, frame=None):
+        stopping.set()
+        for child in children:
+            if child.poll() is None:
+                child.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while not stopping.is_set():
+            for i, child in enumerate(children):
+                if child.poll() is not None and not stopping.is_set():
+                    print(f"Worker {i} exited with status {child.returncode}; restarting it", file=sys.stderr)
+                    children[i] = spawn(i)
+            stopping.wait(0.5)
+    except KeyboardInterrupt:
+        stop()
+    return max(child.wait() for child in children)
+
+
+def _stop_on_sigterm(signum, frame):
+    # Shut down the way Ctrl+C does
+    raise KeyboardInterrupt
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="AI Document Processor API server")
+    parser.add_argument("--host", default=os.environ.get("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 3000)))
+    parser.add_argument("--mode", choices=["threaded", "pool", "single", "asyncio"],
+                        default=os.environ.get("SERVER_MODE", "threaded"),
+                        help="threaded: one thread per connection; pool: fixed worker pool; single: one request at a time; "
+                             "asyncio: event loop for connections, handler threads only while a request runs")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("SERVER_WORKERS", 16)),
+                        help="worker threads in pool and asyncio modes")
+    parser.add_argument("--max-connections", type=int, default=int(os.environ.get("SERVER_MAX_CONNECTIONS", 10000)),
+                        help="open connections before new ones get 503 (asyncio mode)")
+    parser.add_argument("--request-timeout", type=float, default=float(os.environ.get("SERVER_REQUEST_TIMEOUT", 30)),
+                        help="seconds to read a request and run its handler before answering 503 (asyncio mode)")
+    parser.add_argument("--idle-timeout", type=float, default=float(os.environ.get("SERVER_IDLE_TIMEOUT", 75)),
+                        help="seconds an idle keep-alive connection stays open (asyncio mode)")
+    parser.add_argument("--backlog", type=int, default=int(os.environ.get("SERVER_BACKLOG", 128)),
+                        help="listen() backlog for pending connections")
+    parser.add_argument("--processes", type=int, default=int(os.environ.get("SERVER_PROCESSES", 1)),
+                        help="server processes sharing the port (SO_REUSEPORT) and the SQLite store")
+    # Set by the launcher on the processes it starts
+    parser.add_argument("--worker-index", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--feed-start", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--store", choices=["memory", "sqlite"], default=os.environ.get("DOCUMENT_STORE", "memory"),
+                        help="memory: lost on restart; sqlite: persisted with WAL and group commit")
+    parser.add_argument("--db-path", default=os.environ.get("DOCUMENT_DB", os.path.join("data", "documents.db")),
+                        help="database file for --store sqlite")
+    parser.add_argument("--processing-mode", choices=["thread", "process"],
+                        default=os.environ.get("PROCESSING_MODE", "thread"),
+                        help="run the CPU-heavy pipeline stages (OCR, extraction) on threads or in process pools")
+    parser.add_argument("--processing-workers", type=int, default=int(os.environ.get("PROCESSING_WORKERS", 16)),
+                        help="documents in the processing pipeline at once")
+    parser.add_argument("--stage-workers", default=os.environ.get("PIPELINE_STAGE_WORKERS", ""),
+                        help="workers per pipeline stage, e.g. ocr=8,classify=1,extract=8,validate=1")
+    parser.add_argument("--stage-batch", default=os.environ.get("PIPELINE_STAGE_BATCH", ""),
+                        help="batch size per pipeline stage, e.g. ocr=4,validate=32")
+    parser.add_argument("--cache-entries", type=int, default=int(os.environ.get("EXTRACTION_CACHE_ENTRIES", 10000)),
+                        help="processing results kept in the extraction cache")
+    parser.add_argument("--cache-mb", type=int, default=int(os.environ.get("EXTRACTION_CACHE_MB", 64)),
+                        help="size bound for the extraction cache, in MiB")
+    parser.add_argument("--cache-path", default=os.environ.get("EXTRACTION_CACHE_PATH"),
+                        help="SQLite file to persist the extraction cache in (default: memory only)")
+    parser.add_argument("--access-log", default=os.environ.get("ACCESS_LOG", "-"),
+                        help="where request log lines go: - for stdout, a file path, or off")
+    parser.add_argument("--max-queue", type=int, default=int(os.environ.get("PROCESSING_MAX_QUEUE", 1000)),
+                        help="pending processing jobs before uploads get 503")
+    parser.add_argument("--rate-limit", default=os.environ.get("RATE_LIMIT", ""),
+                        help="requests per second per client (Bearer token or address), e.g. api=100,processing=5; 0 turns a budget off")
+    parser.add_argument("--rate-burst", default=os.environ.get("RATE_BURST", ""),
+                        help="requests a client may make at once, e.g. api=200,processing=50")
+    parser.add_argument("--shed-queue", type=float, default=float(os.environ.get("SHED_QUEUE", 0.8)),
+                        help="refuse new processing with 503 once the queue is this full (fraction of --max-queue; 0 = off)")
+    parser.add_argument("--shed-latency", type=float, default=float(os.environ.get("SHED_LATENCY", 1.0)),
+                        help="refuse new processing with 503 while the average request takes longer (seconds; 0 = off)")
+    args = parser.parse_args(argv)
+    try:
+        args.stage_workers = parse_stage_options(args.stage_workers, "--stage-workers")
+        args.stage_batch = parse_stage_options(args.stage_batch, "--stage-batch")
+        args.rate_limit = parse_limits(args.rate_limit, "--rate-limit", RATE_LIMITS)
+        args.rate_burst = parse_limits(args.rate_burst, "--rate-burst", RATE_BURSTS)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.processes > 1:
+        if args.store != "sqlite":
+            parser.error("--processes needs --store sqlite: the memory store can't be shared between processes")
+        if not hasattr(socket, "SO_REUSEPORT"):
+            parser.error("--processes needs SO_REUSEPORT, which this platform lacks")
+    return args
+
 
 if __name__ == "__main__":
-    PORT = 3000
-    server = HTTPServer(("127.0.0.1", PORT), DocumentProcessorHandler)
-    print(f"🚀 AI Document Processor API Server running on http://localhost:{PORT}")
-    print(f"   Health Check: http://localhost:{PORT}/api/health")
-    print(f"   Document Types: http://localhost:{PORT}/api/config/document-types")
-    print("\nPress Ctrl+C to stop the server")
+    args = parse_args()
+    if args.processes > 1 and args.worker_index is None:
+        sys.exit(run_workers(sys.argv[1:], args.processes))
+    PORT = args.port
+    signal.signal(signal.SIGTERM, _stop_on_sigterm)
+    shared = args.processes > 1
+    if shared:
+        configure_change_feed(args.feed_start, args.processes)
+    configure_workers(args.worker_index or 0, args.processes)
+    configure_store(args.store, args.db_path, shared)
+    configure_access_log(args.access_log)
+    configure_cache(args.cache_entries, args.cache_mb * 1024 * 1024, args.cache_path)
+    configure_processing(args.processing_workers, args.max_queue, args.processing_mode, args.stage_workers, args.stage_batch)
+    configure_limits(args.rate_limit, args.rate_burst, args.shed_queue, args.shed_latency)
+    resume_pending_processing()
+    server = make_server(args.host, PORT, mode=args.mode, workers=args.workers, backlog=args.backlog,
+                         max_connections=args.max_connections, request_timeout=args.request_timeout,
+                         idle_timeout=args.idle_timeout, reuse_port=shared)
+    if not args.worker_index:
+        print(f"🚀 AI Document Processor API Server running on http://localhost:{PORT}")
+        print(f"   Mode: {args.mode}" + (f" ({args.workers} workers)" if args.mode in ("pool", "asyncio") else "")
+              + (f", {args.processes} processes" if shared else ""))
+        print(f"   Store: {args.store} ({len(documents)} documents loaded)")
+        print(f"   Health Check: http://localhost:{PORT}/api/health")
+        print(f"   Document Types: http://localhost:{PORT}/api/config/document-types")
+        print("\nPress Ctrl+C to stop the server")
     try:
         server.serve_forever()
     except KeyboardInterrupt:
+        # Ctrl+C reaches the launcher's workers directly as well as through it
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
         print("\n✓ Server stopped gracefully")
         server.server_close()
+        job_queue.stop()
+        pipeline.stop()
+        documents.close()
+        if access_log is not None:
+            access_log.close()
+        extraction_cache.close()
@@ -12,6 +12,9 @@ import uuid
 from datetime import datetime
 from pathlib import Path
 
+from response_encoding import coalesce, iter_compressed, iter_list_json, negotiate
+from static_files import StaticFiles
+
 # In-memory storage
 documents = {}
 document_types = [
@@ -34,6 +37,11 @@ document_types = [
     },
 ]
 
+# Cached HTML pages: simple.html first, app.html as the fallback
+static_files = StaticFiles(os.path.dirname(os.path.abspath(__file__)),
+                           index=("simple.html", "app.html"), aliases=("/app.html", "/simple.html"),
+                           headers=[("Access-Control-Allow-Origin", "*")])
+
 class DocumentProcessorHandler(BaseHTTPRequestHandler):
     def do_POST(self):
         """Handle POST requests"""
@@ -87,18 +95,8 @@ class DocumentProcessorHandler(BaseHTTPRequestHandler):
         
         # Serve static file - try simple.html first, then app.html
         if path == "/" or path == "/app.html" or path == "/simple.html":
-            for filename in ["simple.html", "app.html"]:
-                try:
-                    with open(filename, "r", encoding="utf-8") as f:
-                        content = f.read()
-                    self.send_response(200)
-                    self.send_header("Content-Type", "text/html; charset=utf-8")
-                    self.send_header("Access-Control-Allow-Origin", "*")
-                    self.end_headers()
-                    self.wfile.write(content.encode("utf-8"))
-                    return
-                except FileNotFoundError:
-                    continue
+            if static_files.serve(self, path):
+                return
             
             self.send_response(404)
             self.send_header("Content-Type", "application/json")
@@ -127,13 +125,21 @@ class DocumentProcessorHandler(BaseHTTPRequestHandler):
         
         # Get all documents
         if path == "/api/documents":
+            # Serialized (and compressed) one document at a time; HTTP/1.0 ends the body at close
+            items = list(documents.values())
+            encoding = negotiate(self.headers.get("Accept-Encoding"))
+            chunks = iter_list_json(items, {"total": len(items), "page": 1, "pageSize": 20})
+            if encoding:
+                chunks = iter_compressed(chunks, encoding)
             self.send_response(200)
             self.send_header("Content-Type", "application/json")
             self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Vary", "Accept-Encoding")
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
             self.end_headers()
-            items = list(documents.values())
-            response = {"items": items, "total": len(items), "page": 1, "pageSize": 20}
-            self.wfile.write(json.dumps(response).encode())
+            for chunk in coalesce(chunks):
+                self.wfile.write(chunk)
             return
         
         # Get single document
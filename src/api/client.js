@@ -1,5 +1,5 @@
 import axios from 'axios'
-import { Document, DocumentListResponse, DocumentFilter, PaginationParams, ProcessingResult } from '../types'
+import { Document, DocumentListResponse, DocumentFilter, PaginationParams, ProcessingStatus, ReprocessResponse, BatchResponse, BatchReviewItem, BatchValidateItem, ChangeFeedResponse, DocumentPatch } from '../types'
 
 const API_BASE = '/api'
 
@@ -19,6 +19,22 @@ api.interceptors.request.use((config) => {
   return config
 })
 
+// A throttled (429) or busy (503) read is retried once, after the server's Retry-After
+api.interceptors.response.use(undefined, async (error) => {
+  const { config, response } = error
+  const retryAfter = Number(response?.headers?.['retry-after'])
+  if (
+    config && !config._retried && config.method === 'get' &&
+    (response?.status === 429 || response?.status === 503) &&
+    retryAfter > 0 && retryAfter <= 10
+  ) {
+    config._retried = true
+    await new Promise(resolve => setTimeout(resolve, retryAfter * 1000))
+    return api(config)
+  }
+  return Promise.reject(error)
+})
+
 // Document API
 export const documentApi = {
   upload: (formData: FormData) =>
@@ -37,6 +53,16 @@ export const documentApi = {
   update: (documentId: string, data: Partial<Document>) =>
     api.put<Document>(`/documents/${documentId}`, data),
 
+  // JSON Merge Patch: send only the changed fields, e.g. { extractedData: { total: '12.50' } }.
+  // With `version`, the server answers 412 instead of applying it if the document changed since.
+  patch: (documentId: string, patch: DocumentPatch, version?: number) =>
+    api.patch<Document>(`/documents/${documentId}`, patch, {
+      headers: {
+        'Content-Type': 'application/merge-patch+json',
+        ...(version !== undefined ? { 'If-Match': `"${version}"` } : {}),
+      },
+    }),
+
   delete: (documentId: string) =>
     api.delete(`/documents/${documentId}`),
 
@@ -47,10 +73,48 @@ export const documentApi = {
     api.post<Document>(`/documents/${documentId}/reject`, { comments }),
 
   reprocess: (documentId: string) =>
-    api.post<ProcessingResult>(`/documents/${documentId}/reprocess`),
+    api.post<ReprocessResponse>(`/documents/${documentId}/reprocess`),
+
+  getStatus: (documentId: string, wait?: number) =>
+    api.get<ProcessingStatus>(`/documents/${documentId}/status`, { params: { wait } }),
+
+  batchUpload: (formData: FormData) =>
+    api.post<BatchResponse>('/documents/batch/upload', formData, {
+      headers: { 'Content-Type': 'multipart/form-data' },
+    }),
+
+  batchApprove: (items: BatchReviewItem[]) =>
+    api.post<BatchResponse>('/documents/batch/approve', { items }),
+
+  batchReject: (items: BatchReviewItem[]) =>
+    api.post<BatchResponse>('/documents/batch/reject', { items }),
+
+  batchReprocess: (ids: string[]) =>
+    api.post<BatchResponse>('/documents/batch/reprocess', { ids }),
+
+  batchDelete: (ids: string[]) =>
+    api.post<BatchResponse>('/documents/batch/delete', { ids }),
+
+  batchValidate: (items: BatchValidateItem[]) =>
+    api.post<BatchResponse>('/documents/batch/validate', { items }),
 
   search: (query: string) =>
     api.get<DocumentListResponse>('/documents/search', { params: { q: query } }),
+
+  // Long-poll for changes after `since`, waiting up to `wait` seconds when there are none
+  changes: (since?: number, wait?: number, ids?: string[]) =>
+    api.get<ChangeFeedResponse>('/documents/changes', {
+      params: { since, wait, ids: ids?.join(',') },
+    }),
+
+  // URL for an EventSource following the change feed
+  changeStreamUrl: (since?: number, ids?: string[]) => {
+    const params = new URLSearchParams()
+    if (since !== undefined) params.set('since', String(since))
+    if (ids?.length) params.set('ids', ids.join(','))
+    const query = params.toString()
+    return `${API_BASE}/documents/changes/stream${query ? `?${query}` : ''}`
+  },
 }
 
 // Configuration API
@@ -11,10 +11,12 @@ import {
 } from '@mui/material'
 import { Link as RouterLink } from 'react-router-dom'
 import { useAuthStore } from '../context/authStore'
+import { useDocumentChanges } from '../hooks/useDocuments'
 
 function Layout({ children }) {
   const [anchorEl, setAnchorEl] = React.useState(null)
   const { user, logout } = useAuthStore()
+  useDocumentChanges()
 
   const handleMenuOpen = (event) => {
     setAnchorEl(event.currentTarget)
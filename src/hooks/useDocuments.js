@@ -1,6 +1,7 @@
-import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query'
+import { useEffect } from 'react'
+import { useQuery, useMutation, useQueryClient, QueryClient } from '@tanstack/react-query'
 import { documentApi, configApi } from '../api/client'
-import { Document, DocumentFilter, PaginationParams, DocumentListResponse } from '../types'
+import { Document, DocumentChange, DocumentFilter, DocumentPatch, PaginationParams, DocumentListResponse } from '../types'
 
 // Document Hooks
 export const useDocumentList = (filter?: DocumentFilter, pagination?: PaginationParams) => {
@@ -33,8 +34,9 @@ export const useApproveDocument = () => {
   return useMutation({
     mutationFn: ({ documentId, comments }: { documentId: string; comments?: string }) =>
       documentApi.approve(documentId, comments).then(res => res.data),
-    onSuccess: () => {
-      queryClient.invalidateQueries({ queryKey: ['documents'] })
+    // Lists pick up the new review status from the change feed
+    onSuccess: (document: Document) => {
+      queryClient.setQueryData(['document', document.id], document)
     },
   })
 }
@@ -44,8 +46,25 @@ export const useRejectDocument = () => {
   return useMutation({
     mutationFn: ({ documentId, comments }: { documentId: string; comments: string }) =>
       documentApi.reject(documentId, comments).then(res => res.data),
-    onSuccess: () => {
-      queryClient.invalidateQueries({ queryKey: ['documents'] })
+    onSuccess: (document: Document) => {
+      queryClient.setQueryData(['document', document.id], document)
+    },
+  })
+}
+
+// Saves just the edited fields; fails with a 412 if someone else changed the document first
+export const usePatchDocument = () => {
+  const queryClient = useQueryClient()
+  return useMutation({
+    mutationFn: ({ documentId, patch, version }: { documentId: string; patch: DocumentPatch; version?: number }) =>
+      documentApi.patch(documentId, patch, version).then(res => res.data),
+    onSuccess: (document: Document) => {
+      queryClient.setQueryData(['document', document.id], document)
+    },
+    onError: (error: any, { documentId }) => {
+      if (error.response?.status === 412) {
+        queryClient.invalidateQueries({ queryKey: ['document', documentId] })
+      }
     },
   })
 }
@@ -55,9 +74,7 @@ export const useReprocessDocument = () => {
   return useMutation({
     mutationFn: (documentId: string) =>
       documentApi.reprocess(documentId).then(res => res.data),
-    onSuccess: () => {
-      queryClient.invalidateQueries({ queryKey: ['documents'] })
-    },
+    // The status changes (processing, then completed) arrive through the change feed
   })
 }
 
@@ -69,6 +86,48 @@ export const useSearchDocuments = (query: string) => {
   })
 }
 
+// Change feed
+
+const applyChange = (queryClient: QueryClient, change: DocumentChange) => {
+  if (change.op !== 'update') {
+    // A document appeared or went away: list membership and totals change
+    queryClient.invalidateQueries({ queryKey: ['documents'] })
+    if (change.op === 'delete') {
+      queryClient.removeQueries({ queryKey: ['document', change.id] })
+    }
+    return
+  }
+  queryClient.setQueryData(['document', change.id], (document?: Document) =>
+    document ? { ...document, ...change.fields } : document
+  )
+  queryClient.setQueriesData({ queryKey: ['documents'] }, (list?: DocumentListResponse) => {
+    if (!list?.items?.some(item => item.id === change.id)) return list
+    return {
+      ...list,
+      items: list.items.map(item => (item.id === change.id ? { ...item, ...change.fields } : item)),
+    }
+  })
+}
+
+// Keeps cached documents and lists current from the server's change feed, so
+// they don't have to be refetched after uploads, reviews or reprocessing.
+// Mount once, near the root; EventSource reconnects and resumes by itself.
+export const useDocumentChanges = () => {
+  const queryClient = useQueryClient()
+  useEffect(() => {
+    const source = new EventSource(documentApi.changeStreamUrl())
+    source.addEventListener('change', (event: MessageEvent) => {
+      applyChange(queryClient, JSON.parse(event.data))
+    })
+    source.addEventListener('reset', () => {
+      // Changes were missed (e.g. the server restarted): start over from fresh data
+      queryClient.invalidateQueries({ queryKey: ['documents'] })
+      queryClient.invalidateQueries({ queryKey: ['document'] })
+    })
+    return () => source.close()
+  }, [queryClient])
+}
+
 // Configuration Hooks
 export const useDocumentTypes = () => {
   return useQuery({
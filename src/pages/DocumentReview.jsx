@@ -14,7 +14,7 @@ import {
   DialogActions,
 } from '@mui/material'
 import { useParams } from 'react-router-dom'
-import { useDocument, useDocumentType, useApproveDocument, useRejectDocument } from '../hooks/useDocuments'
+import { useDocument, useDocumentType, useApproveDocument, useRejectDocument, usePatchDocument } from '../hooks/useDocuments'
 import DocumentViewer from '../components/DocumentViewer'
 import DynamicForm from '../components/DynamicForm'
 
@@ -28,6 +28,7 @@ function DocumentReview() {
   const { data: docType } = useDocumentType(document?.documentTypeId)
   const approveMutation = useApproveDocument()
   const rejectMutation = useRejectDocument()
+  const patchMutation = usePatchDocument()
 
   if (docLoading) {
     return (
@@ -70,12 +71,26 @@ function DocumentReview() {
 
   const handleEditSubmit = async (data: Record<string, any>) => {
     if (documentId) {
+      // Send only the fields that were edited
+      const changed = Object.fromEntries(
+        Object.entries(data).filter(([key, value]) => value !== document.extractedData[key])
+      )
+      if (Object.keys(changed).length === 0) {
+        setEditMode(false)
+        return
+      }
       try {
-        // This would call an update API
-        console.log('Updated data:', data)
+        await patchMutation.mutateAsync({
+          documentId,
+          patch: { extractedData: changed },
+          version: document.version,
+        })
         alert('Document updated successfully')
         setEditMode(false)
       } catch (error: any) {
+        if (error.response?.status === 412) {
+          throw new Error('Someone else changed this document; it has been reloaded, please review and save again')
+        }
         throw new Error(error.message || 'Failed to update document')
       }
     }
@@ -92,7 +107,7 @@ function DocumentReview() {
           template={docType.extractionTemplate}
           initialData={document.extractedData}
           onSubmit={handleEditSubmit}
-          isLoading={approveMutation.isPending || rejectMutation.isPending}
+          isLoading={approveMutation.isPending || rejectMutation.isPending || patchMutation.isPending}
         />
       ) : (
         <DocumentViewer
@@ -101,7 +116,7 @@ function DocumentReview() {
           onEdit={() => setEditMode(true)}
           onApprove={handleApprove}
           onReject={() => setRejectDialogOpen(true)}
-          isLoading={approveMutation.isPending || rejectMutation.isPending}
+          isLoading={approveMutation.isPending || rejectMutation.isPending || patchMutation.isPending}
         />
       )}
 
@@ -64,6 +64,15 @@ export interface Document {
   reviewedBy?: string
   reviewedAt?: string
   comments?: string
+  contentHash?: string
+  duplicateOf?: string
+  // Bumped by every write; send it back (If-Match) to edit only the version you saw
+  version: number
+}
+
+// JSON Merge Patch for PATCH /documents/{id}: nested objects merge, null removes a key
+export type DocumentPatch = {
+  [K in keyof Document]?: K extends 'extractedData' ? Record<string, any> | null : Document[K] | null
 }
 
 export interface DocumentMetadata {
@@ -98,6 +107,19 @@ export interface ApiResponse<T> {
   message?: string
 }
 
+export type DocumentSummary = Pick<Document,
+  'id' | 'fileName' | 'fileType' | 'fileSize' | 'uploadedAt' | 'documentTypeId' |
+  'status' | 'reviewStatus' | 'confidence' | 'reviewedAt' | 'reviewedBy' | 'version'>
+
+/**
+ * Sparse fieldsets: list endpoints default to view=summary, detail to view=full
+ */
+export interface ProjectionParams {
+  view?: 'summary' | 'full'
+  fields?: string   // comma-separated, dotted paths allowed (metadata.classification)
+  exclude?: string
+}
+
 export interface DocumentListResponse {
   items: Document[]
   total: number
@@ -105,6 +127,77 @@ export interface DocumentListResponse {
   pageSize: number
 }
 
+export interface DocumentCursorResponse {
+  items: Document[]
+  nextCursor: string | null
+  pageSize: number
+  total?: number
+}
+
+export interface BatchReviewItem {
+  id: string
+  comments?: string
+}
+
+export interface BatchItemResult {
+  index: number
+  id: string | null
+  success: boolean
+  status: number
+  error?: string
+  document?: Document
+  errors?: string[] // validation messages, for batch/validate
+}
+
+export interface BatchValidateItem {
+  id: string
+  extractedData?: Record<string, any> // edits to apply; omitted to re-check the stored data
+}
+
+export interface BatchResponse {
+  results: BatchItemResult[]
+  succeeded: number
+  failed: number
+}
+
+export interface ProcessingJob {
+  documentId: string
+  state: 'queued' | 'processing' | 'completed' | 'failed'
+  queuedAt: string
+  startedAt: string | null
+  finishedAt: string | null
+  error: string | null
+}
+
+export interface ProcessingStatus {
+  documentId: string
+  status: Document['status']
+  job: ProcessingJob | null
+  queueDepth: number
+}
+
+export interface ReprocessResponse {
+  documentId: string
+  status: 'processing'
+  job: ProcessingJob
+}
+
+export interface DocumentChange {
+  seq: number
+  id: string
+  op: 'put' | 'update' | 'delete'
+  // put: the document's summary fields; update: only the fields that changed (never ocrText)
+  fields: Partial<Document>
+}
+
+export interface ChangeFeedResponse {
+  events: DocumentChange[]
+  // Pass back as `since` to continue after these events
+  seq: number
+  // The requested position is gone (too old, or from before a restart): refetch, then follow from `seq`
+  reset: boolean
+}
+
 export interface ProcessingResult {
   documentId: string
   status: 'success' | 'failed'
@@ -149,3 +242,10 @@ export interface PaginationParams {
   sortBy?: string
   sortOrder?: 'asc' | 'desc'
 }
+
+export interface CursorParams {
+  cursor: string
+  pageSize: number
+  sortOrder?: 'asc' | 'desc'
+  includeTotal?: boolean
+}
@@ -0,0 +1,253 @@
+"""
+AI Document Processor - Static file serving
+In-memory cache keyed by mtime, precompressed variants, conditional GET,
+range requests and sendfile for large files
+"""
+
+from email.utils import formatdate, parsedate_to_datetime
+import gzip
+import mimetypes
+import os
+import threading
+
+try:
+    import brotli
+except ImportError:  # optional dependency; gzip is always available
+    brotli = None
+
+# Files up to this size are kept in memory; larger ones are streamed with sendfile
+MAX_CACHED_SIZE = 1024 * 1024
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+# The only files served besides the index; everything else in the root (sources,
+# package.json, notes) stays private
+PUBLIC_FILES = ("app.html", "simple.html", "ai_document_processor_spec.pdf")
+CACHE_CONTROL = "public, max-age=0, must-revalidate"
+# Appended to the ETag of a compressed representation, whose bytes differ from the file's
+ETAG_SUFFIXES = {"gzip": "gz", "br": "br"}
+
+
+class StaticEntry:
+    """One file as of a given mtime: validators plus cached bodies"""
+
+    __slots__ = ("path", "mtime", "size", "etag", "last_modified", "content_type", "body", "encoded")
+
+    def __init__(self, path, stat):
+        self.path = path
+        self.mtime = stat.st_mtime_ns
+        self.size = stat.st_size
+        self.etag = '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/"):
+            content_type += "; charset=utf-8"
+        self.content_type = content_type
+        self.body = None
+        # encoding -> precompressed bytes
+        self.encoded = {}
+        if self.size <= MAX_CACHED_SIZE:
+            with open(path, "rb") as f:
+                self.body = f.read()
+            if content_type.startswith(COMPRESSIBLE_TYPES):
+                self._compress()
+
+    def etag_for(self, encoding):
+        """Strong ETag of the file as sent with `encoding` (None for the file itself)"""
+        if encoding is None:
+            return self.etag
+        return '%s-%s"' % (self.etag[:-1], ETAG_SUFFIXES[encoding])
+
+    def _compress(self):
+        # Prefer variants built ahead of time (app.html.gz / app.html.br) when they are current
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            variant = self.path + suffix
+            try:
+                if os.stat(variant).st_mtime_ns >= self.mtime:
+                    with open(variant, "rb") as f:
+                        self.encoded[encoding] = f.read()
+            except FileNotFoundError:
+                pass
+        if "gzip" not in self.encoded:
+            self.encoded["gzip"] = gzip.compress(self.body, compresslevel=9, mtime=0)
+        if "br" not in self.encoded and brotli is not None:
+            self.encoded["br"] = brotli.compress(self.body)
+        # Drop variants that don't actually save anything
+        self.encoded = {e: b for e, b in self.encoded.items() if len(b) < len(self.body)}
+
+
+def _accepted_encodings(header):
+    accepted = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.lower()] = q
+    return accepted
+
+
+def _parse_range(header, size):
+    """Parse a single 'bytes=' range; returns (start, end) inclusive, None to ignore, or False if unsatisfiable"""
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[6:].strip().partition("-")
+    try:
+        if not start:
+            length = int(end)
+            if length <= 0:
+                return False
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+class StaticFiles:
+    """Serves whitelisted files from one directory through a BaseHTTPRequestHandler
+
+    `index` lists the files tried, in order, for "/" (and the aliases in
+    `aliases`); other paths are served only when they name one of `files`
+    directly under `root`. `headers` are added to every response.
+    """
+
+    def __init__(self, root=".", index=("app.html",), aliases=("/index.html",), files=PUBLIC_FILES, headers=()):
+        self.root = os.path.abspath(root)
+        self.headers = tuple(headers)
+        self.index = tuple(index)
+        self.aliases = tuple(aliases)
+        self.files = frozenset(files)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, url_path):
+        """Map a URL path to a file under root, or None"""
+        if url_path == "/" or url_path in self.aliases:
+            candidates = self.index
+        else:
+            name = url_path.lstrip("/")
+            if name not in self.files:
+                return None
+            candidates = (name,)
+        for name in candidates:
+            path = os.path.join(self.root, name)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def entry(self, path):
+        """Cached StaticEntry for path, re-read if the file changed since"""
+        stat = os.stat(path)
+        entry = self._entries.get(path)
+        if entry is None or entry.mtime != stat.st_mtime_ns or entry.size != stat.st_size:
+            entry = StaticEntry(path, stat)
+            with self._lock:
+                self._entries[path] = entry
+        return entry
+
+    def serve(self, handler, url_path):
+        """Answer a GET/HEAD for url_path; returns False if no such file (nothing sent)"""
+        path = self.resolve(url_path)
+        if path is None:
+            return False
+        try:
+            entry = self.entry(path)
+        except FileNotFoundError:
+            return False
+        head = handler.command == "HEAD"
+        headers = handler.headers
+
+        byte_range = None
+        if_range = headers.get("If-Range")
+        if headers.get("Range") and (not if_range or if_range in (entry.etag, entry.last_modified)):
+            byte_range = _parse_range(headers.get("Range"), entry.size)
+
+        # Ranges are served from the file itself; everything else may be compressed
+        encoding = None
+        if byte_range is None and entry.encoded:
+            accepted = _accepted_encodings(headers.get("Accept-Encoding"))
+            for candidate in ("br", "gzip"):
+                if candidate in entry.encoded and accepted.get(candidate, 0) > 0:
+                    encoding = candidate
+                    break
+        etag = entry.etag_for(encoding)
+
+        common = [
+            ("ETag", etag),
+            ("Last-Modified", entry.last_modified),
+            ("Cache-Control", CACHE_CONTROL),
+            ("Accept-Ranges", "bytes"),
+        ] + list(self.headers)
+        if entry.encoded:
+            common.append(("Vary", "Accept-Encoding"))
+
+        if self._not_modified(headers, entry, etag):
+            handler.send_response(304)
+            for name, value in common:
+                handler.send_header(name, value)
+            handler.end_headers()
+            return True
+
+        if byte_range is False:
+            handler.send_response(416)
+            handler.send_header("Content-Range", f"bytes */{entry.size}")
+            handler.send_header("Content-Length", "0")
+            for name, value in common:
+                handler.send_header(name, value)
+            handler.end_headers()
+            return True
+
+        if byte_range is not None:
+            start, end = byte_range
+            handler.send_response(206)
+            handler.send_header("Content-Range", f"bytes {start}-{end}/{entry.size}")
+        else:
+            start, end = 0, entry.size - 1
+            handler.send_response(200)
+        body = entry.encoded[encoding] if encoding else None
+        length = len(body) if body is not None else end - start + 1
+        handler.send_header("Content-Type", entry.content_type)
+        handler.send_header("Content-Length", str(length))
+        if encoding:
+            handler.send_header("Content-Encoding", encoding)
+        for name, value in common:
+            handler.send_header(name, value)
+        handler.end_headers()
+        if head or length == 0:
+            return True
+
+        if body is not None:
+            handler.wfile.write(body)
+        elif entry.body is not None:
+            handler.wfile.write(entry.body[start:end + 1])
+        else:
+            handler.wfile.flush()
+            with open(entry.path, "rb") as f:
+                # Zero-copy where the OS supports it; falls back to send() elsewhere
+                sent = handler.connection.sendfile(f, start, length)
+            # Bytes sent this way bypass wfile; tell a byte-counting wfile (metrics.CountingWriter) about them
+            if hasattr(handler.wfile, "count"):
+                handler.wfile.count += sent
+        return True
+
+    @staticmethod
+    def _not_modified(headers, entry, etag):
+        if_none_match = headers.get("If-None-Match")
+        if if_none_match:
+            tags = [t.strip() for t in if_none_match.split(",")]
+            return "*" in tags or etag in tags or ("W/" + etag) in tags
+        if_modified_since = headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError, AttributeError):
+                return False
+            return int(entry.mtime / 1e9) <= since
+        return False
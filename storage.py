@@ -0,0 +1,368 @@
+"""
+AI Document Processor - Storage backends for DocumentStore
+MemoryBackend keeps nothing; SQLiteBackend persists documents in SQLite (WAL mode)
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+from records import to_json_compatible
+
+
+class CommitTicket:
+    """Handed back for every write; wait() returns once that write is durable"""
+
+    __slots__ = ("_done", "error")
+
+    def __init__(self):
+        self._done = threading.Event()
+        self.error = None
+
+    def resolve(self, error=None):
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("Timed out waiting for the document store to commit")
+        if self.error is not None:
+            raise self.error
+
+
+_COMMITTED = CommitTicket()
+_COMMITTED.resolve()
+
+
+class MemoryBackend:
+    """No persistence: documents live only in the DocumentStore's dict"""
+
+    def load(self):
+        return iter(())
+
+    def save(self, doc, fields=None):
+        return _COMMITTED
+
+    def delete(self, doc_id):
+        return _COMMITTED
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def has_changes(self):
+        return False
+
+    def pending_ids(self):
+        return set()
+
+    def poll(self, skip=()):
+        return None
+
+
+class SQLiteBackend:
+    """Documents persisted to a SQLite database in WAL mode with group commit
+
+    Writes are queued and applied by a single writer thread. Whatever has
+    queued up while the previous transaction was committing goes into the
+    next one, so concurrent writers share a commit instead of paying one
+    fsync each. The WAL is checkpointed automatically, which keeps it from
+    growing without bound. Startup still reads every stored document back
+    (see DocumentStore._load), so recovery time grows with the size of the
+    database.
+
+    With `shared` set, several server processes use the same database.
+    Each commit also appends the ids it wrote to a `changes` table, and
+    poll() returns the documents other processes have written since the
+    last poll. `PRAGMA data_version` tells whether anything was committed
+    in the meantime, so a poll that finds nothing new costs one query.
+    The oldest `keep_changes` rows are pruned as the table grows. A save
+    given the `fields` it changed writes just those fields into the stored
+    body, so two processes updating different fields of one document don't
+    overwrite each other's changes with their own stale copies; the
+    `version` field is set past the stored one rather than copied.
+    """
+
+    def __init__(self, path, max_batch=512, synchronous="NORMAL", shared=False, keep_changes=100000):
+        self.path = str(path)
+        self.max_batch = max_batch
+        self.synchronous = synchronous
+        self.shared = shared
+        self.keep_changes = keep_changes
+        # Identifies this process's rows in the changes table
+        self.origin = uuid.uuid4().hex
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " id TEXT PRIMARY KEY,"
+            " body TEXT NOT NULL)"
+        )
+        if shared:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS changes ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " doc_id TEXT NOT NULL,"
+                " origin TEXT NOT NULL)"
+            )
+        conn.commit()
+        conn.close()
+        self._commits = 0
+        self._cursor = 0
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._deferred = set()
+        self._reader = None
+        self._read_lock = threading.Lock()
+        self._data_version = None
+        if shared:
+            self._reader = self._connect(isolation_level=None)
+            self._data_version = self._version()
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self, **options):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, **options)
+        # Switching a new database to WAL fails at once, without the busy
+        # timeout, while another process (a sibling worker) is doing the same
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                break
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or time.monotonic() > deadline:
+                    conn.close()
+                    raise
+                time.sleep(0.05)
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        return conn
+
+    def load(self):
+        """Yield every stored document, in insertion order"""
+        conn = self._connect(isolation_level=None)
+        try:
+            # One read transaction, so the change cursor matches the documents read
+            conn.execute("BEGIN")
+            if self.shared:
+                self._cursor = self._latest_change(conn)
+            for (body,) in conn.execute("SELECT body FROM documents ORDER BY rowid"):
+                yield json.loads(body)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def save(self, doc, fields=None):
+        ticket = CommitTicket()
+        self._track(doc["id"])
+        fields = tuple(fields) if fields is not None else None
+        # Only plain names can go into a JSON path; anything else saves the whole document
+        if self.shared and fields is not None and all(field.isidentifier() for field in fields):
+            self._writes.put(("update", doc["id"], (doc, fields), ticket))
+        else:
+            self._writes.put(("save", doc["id"], doc, ticket))
+        return ticket
+
+    def delete(self, doc_id):
+        ticket = CommitTicket()
+        self._track(doc_id)
+        self._writes.put(("delete", doc_id, None, ticket))
+        return ticket
+
+    def flush(self):
+        ticket = CommitTicket()
+        self._writes.put(("flush", None, None, ticket))
+        ticket.wait()
+
+    def close(self):
+        self.flush()
+        self._writes.put(None)
+        self._writer.join()
+        if self._reader is not None:
+            self._reader.close()
+
+    # Writes from other processes (shared mode)
+
+    def _track(self, doc_id):
+        if self.shared:
+            with self._pending_lock:
+                self._pending[doc_id] = self._pending.get(doc_id, 0) + 1
+
+    def _untrack(self, doc_ids):
+        with self._pending_lock:
+            for doc_id in doc_ids:
+                left = self._pending.pop(doc_id) - 1
+                if left:
+                    self._pending[doc_id] = left
+
+    def pending_ids(self):
+        """Ids with writes from this process that are queued but not yet committed"""
+        with self._pending_lock:
+            return set(self._pending)
+
+    def _version(self):
+        return self._reader.execute("PRAGMA data_version").fetchone()[0]
+
+    @staticmethod
+    def _latest_change(conn):
+        return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def has_changes(self):
+        """Whether anything was committed since the last poll (by any connection, this process's writer included)"""
+        if not self.shared:
+            return False
+        with self._read_lock:
+            return self._version() != self._data_version
+
+    def poll(self, skip=()):
+        """Documents other processes wrote since the last poll
+
+        Returns None when nothing was committed, else (documents, complete):
+        documents maps each id to its current body, or to None if it was
+        deleted. `complete` means the changes table no longer reaches back
+        to the last poll, so documents holds every stored document instead
+        and anything missing from it has been deleted. Ids in `skip` (this
+        process's uncommitted writes) are left out for now and returned by
+        a later poll, once those writes have committed.
+        """
+        if not self.shared:
+            return None
+        with self._read_lock:
+            version = self._version()
+            if version == self._data_version:
+                return None
+            self._data_version = version
+            conn = self._reader
+            conn.execute("BEGIN")
+            try:
+                oldest = conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+                if oldest is not None and oldest > self._cursor + 1:
+                    self._cursor = self._latest_change(conn)
+                    self._deferred = set(skip)
+                    docs = {
+                        doc_id: json.loads(body)
+                        for doc_id, body in conn.execute("SELECT id, body FROM documents ORDER BY rowid")
+                        if doc_id not in skip
+                    }
+                    return docs, True
+                rows = conn.execute(
+                    "SELECT seq, doc_id, origin FROM changes WHERE seq > ? ORDER BY seq", (self._cursor,)
+                ).fetchall()
+                if rows:
+                    self._cursor = rows[-1][0]
+                ids = self._deferred | {doc_id for _, doc_id, origin in rows if origin != self.origin}
+                self._deferred = ids & set(skip)
+                ids -= self._deferred
+                docs = dict.fromkeys(ids)
+                ids = list(ids)
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    marks = ",".join("?" * len(chunk))
+                    for doc_id, body in conn.execute(f"SELECT id, body FROM documents WHERE id IN ({marks})", chunk):
+                        docs[doc_id] = json.loads(body)
+                return docs, False
+            finally:
+                conn.execute("COMMIT")
+
+    def _write_loop(self):
+        conn = self._connect()
+        try:
+            while True:
+                item = self._writes.get()
+                if item is None:
+                    return
+                batch = [item]
+                while len(batch) < self.max_batch:
+                    try:
+                        item = self._writes.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        self._writes.put(None)
+                        break
+                    batch.append(item)
+                self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        # Later writes to the same id supersede earlier ones in the batch;
+        # field updates following a save or another update fold into it
+        latest = {}
+        for op, doc_id, doc, _ in batch:
+            if op == "flush":
+                continue
+            previous = latest.pop(doc_id, None)
+            if op == "update" and previous is not None and previous[0] != "delete":
+                doc, fields = doc
+                if previous[0] == "save":
+                    op = "save"
+                else:
+                    doc = (doc, tuple(dict.fromkeys(previous[1][1] + fields)))
+            latest[doc_id] = (op, doc)
+        error = None
+        try:
+            with conn:
+                for doc_id, (op, doc) in latest.items():
+                    if op == "save":
+                        conn.execute(
+                            "INSERT INTO documents (id, body) VALUES (?, ?)"
+                            " ON CONFLICT(id) DO UPDATE SET body = excluded.body",
+                            (doc_id, json.dumps(doc, default=to_json_compatible)),
+                        )
+                    elif op == "update":
+                        doc, fields = doc
+                        paths = []
+                        values = []
+                        for field in fields:
+                            if field == "version":
+                                # Past whatever another process stored, so two processes'
+                                # concurrent writes never end up with the same version
+                                paths.append("'$.version', MAX(COALESCE(json_extract(body, '$.version'), 1) + 1, ?)")
+                                values.append(doc.get("version"))
+                            else:
+                                paths.append("?, json(?)")
+                                values.append('$."' + field + '"')
+                                values.append(json.dumps(doc.get(field), default=to_json_compatible))
+                        conn.execute(f"UPDATE documents SET body = json_set(body, {', '.join(paths)}) WHERE id = ?",
+                                     (*values, doc_id))
+                    else:
+                        conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+                if self.shared and latest:
+                    conn.executemany(
+                        "INSERT INTO changes (doc_id, origin) VALUES (?, ?)",
+                        [(doc_id, self.origin) for doc_id in latest],
+                    )
+                    self._commits += 1
+                    if self._commits % 256 == 0:
+                        conn.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?",
+                                     (self.keep_changes,))
+        except Exception as e:
+            error = e
+        if self.shared:
+            self._untrack([doc_id for op, doc_id, _, _ in batch if op != "flush"])
+        for _, _, _, ticket in batch:
+            ticket.resolve(error)
+
+
+def open_backend(kind="memory", path=None, shared=False):
+    """Build a storage backend by name (as given on the command line)
+
+    `shared` means other processes use the same store (sqlite only).
+    """
+    if kind == "memory":
+        if shared:
+            raise ValueError("The memory store can't be shared between processes")
+        return MemoryBackend()
+    if kind == "sqlite":
+        return SQLiteBackend(path or os.path.join("data", "documents.db"), shared=shared)
+    raise ValueError(f"Unknown document store: {kind}")
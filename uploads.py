@@ -0,0 +1,232 @@
+"""
+AI Document Processor - Streaming upload ingestion
+Spools uploaded files to disk in fixed-size chunks so memory per upload
+stays bounded no matter how large the file is
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+# Limits for the small, in-memory parts of a multipart body
+MAX_HEADER_BYTES = 16 * 1024
+MAX_FIELD_BYTES = 64 * 1024
+
+_PARAM_RE = re.compile(r';\s*([\w*-]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^;]*)')
+
+
+class UploadError(Exception):
+    """The request body is not a well-formed upload"""
+
+
+class SpooledFile:
+    """A file streamed to disk, with its size and SHA-256 computed on the way"""
+
+    def __init__(self, field_name, filename, content_type, path, size, sha256):
+        self.field_name = field_name
+        self.filename = filename
+        self.content_type = content_type
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    def move_to(self, path):
+        os.replace(self.path, path)
+        self.path = path
+
+    def discard(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def parse_header_params(value):
+    """Split 'form-data; name="file"; filename="a.pdf"' into ('form-data', {...})"""
+    main, _, rest = value.partition(";")
+    params = {}
+    for key, val in _PARAM_RE.findall(";" + rest):
+        val = val.strip()
+        if len(val) >= 2 and val[0] == val[-1] == '"':
+            val = val[1:-1].replace('\\"', '"')
+        params[key.lower()] = val
+    return main.strip().lower(), params
+
+
+class BodyReader:
+    """Reads a request body framed by Content-Length or chunked transfer encoding"""
+
+    def __init__(self, rfile, content_length=None, chunked=False):
+        self._rfile = rfile
+        self._remaining = content_length or 0
+        self._chunked = chunked
+        self._chunk_left = 0
+        self._done = not chunked and not content_length
+
+    def read(self, size=CHUNK_SIZE):
+        if self._done:
+            return b""
+        if not self._chunked:
+            data = self._rfile.read(min(size, self._remaining))
+            if not data:
+                raise UploadError("Request body ended early")
+            self._remaining -= len(data)
+            self._done = self._remaining == 0
+            return data
+        if self._chunk_left == 0:
+            line = self._rfile.readline(1024)
+            try:
+                self._chunk_left = int(line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise UploadError("Malformed chunked body")
+            if self._chunk_left == 0:
+                # Skip trailers up to the terminating blank line
+                while self._rfile.readline(1024) not in (b"\r\n", b"\n", b""):
+                    pass
+                self._done = True
+                return b""
+        data = self._rfile.read(min(size, self._chunk_left))
+        if not data:
+            raise UploadError("Request body ended early")
+        self._chunk_left -= len(data)
+        if self._chunk_left == 0:
+            self._rfile.readline(1024)
+        return data
+
+    def drain(self):
+        while self.read():
+            pass
+
+
+class _Spool:
+    def __init__(self, upload_dir):
+        fd, self.path = tempfile.mkstemp(prefix="upload-", suffix=".part", dir=upload_dir)
+        self._file = os.fdopen(fd, "wb")
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._file.write(data)
+        self._hash.update(data)
+        self.size += len(data)
+
+    def close(self, field_name, filename, content_type):
+        self._file.close()
+        return SpooledFile(field_name, filename, content_type, self.path, self.size, self._hash.hexdigest())
+
+    def abort(self):
+        self._file.close()
+        os.unlink(self.path)
+
+
+def spool_raw(reader, upload_dir, filename, content_type):
+    """Stream a raw binary body to disk"""
+    os.makedirs(upload_dir, exist_ok=True)
+    spool = _Spool(upload_dir)
+    try:
+        while True:
+            data = reader.read(CHUNK_SIZE)
+            if not data:
+                break
+            spool.write(data)
+    except BaseException:
+        spool.abort()
+        raise
+    return spool.close("file", filename, content_type)
+
+
+def spool_multipart(reader, boundary, upload_dir):
+    """Stream a multipart/form-data body, spooling file parts to disk
+
+    Returns (fields, files): plain form fields as a dict of strings and file
+    parts as SpooledFile objects. Only one chunk plus the delimiter length is
+    held in memory at a time.
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+    delimiter = b"\r\n--" + boundary.encode("latin-1")
+    fields = {}
+    files = []
+    # Prefixing CRLF lets the first boundary match the same delimiter as the rest
+    buf = b"\r\n"
+    eof = False
+
+    def fill():
+        nonlocal buf, eof
+        data = reader.read(CHUNK_SIZE)
+        if data:
+            buf += data
+        else:
+            eof = True
+
+    # Preamble: everything up to the first delimiter is ignored
+    while True:
+        i = buf.find(delimiter)
+        if i >= 0:
+            buf = buf[i + len(delimiter):]
+            break
+        if eof:
+            raise UploadError("Multipart boundary not found")
+        buf = buf[-len(delimiter):]
+        fill()
+
+    try:
+        while True:
+            while len(buf) < 2 and not eof:
+                fill()
+            if buf.startswith(b"--"):
+                break
+            if not buf.startswith(b"\r\n"):
+                raise UploadError("Malformed multipart delimiter")
+            buf = buf[2:]
+
+            while b"\r\n\r\n" not in buf:
+                if eof or len(buf) > MAX_HEADER_BYTES:
+                    raise UploadError("Malformed multipart part headers")
+                fill()
+            raw_headers, buf = buf.split(b"\r\n\r\n", 1)
+            headers = {}
+            for line in raw_headers.decode("utf-8", "replace").split("\r\n"):
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            _, disposition = parse_header_params(headers.get("content-disposition", ""))
+            field_name = disposition.get("name", "")
+            filename = disposition.get("filename")
+
+            spool = _Spool(upload_dir) if filename is not None else None
+            value = bytearray()
+            try:
+                while True:
+                    i = buf.find(delimiter)
+                    if i >= 0:
+                        data, buf = buf[:i], buf[i + len(delimiter):]
+                    else:
+                        # Keep a tail that could be the start of a split delimiter
+                        keep = len(delimiter) - 1
+                        data, buf = buf[:-keep] if len(buf) > keep else b"", buf[-keep:] if len(buf) > keep else buf
+                    if spool is not None:
+                        spool.write(data)
+                    else:
+                        value += data
+                        if len(value) > MAX_FIELD_BYTES:
+                            raise UploadError(f"Form field '{field_name}' is too large")
+                    if i >= 0:
+                        break
+                    if eof:
+                        raise UploadError("Multipart body ended early")
+                    fill()
+            except BaseException:
+                if spool is not None:
+                    spool.abort()
+                raise
+            if spool is not None:
+                files.append(spool.close(field_name, filename, headers.get("content-type", "application/octet-stream")))
+            else:
+                fields[field_name] = value.decode("utf-8", "replace")
+    except BaseException:
+        for f in files:
+            f.discard()
+        raise
+    reader.drain()
+    return fields, files
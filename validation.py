@@ -0,0 +1,259 @@
+"""
+AI Document Processor - Validation engine
+Compiles each document type's extractionTemplate fields and validationRules
+into validator callables, once per type definition
+"""
+
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+import re
+import threading
+
+# Date formats accepted for "date" fields, tried in order after ISO 8601
+DATE_FORMATS = ("%m/%d/%Y", "%d.%m.%Y", "%B %d, %Y", "%b %d, %Y", "%d %B %Y", "%d %b %Y")
+
+_ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_CURRENCY_RE = re.compile(
+    r"\s*(?P<code>[A-Z]{3}\s?)?(?P<symbol>[$€£¥]\s?)?(?P<sign>-)?"
+    r"(?P<amount>\d{1,3}(?:,\d{3})+|\d+)(?P<cents>\.\d{1,2})?\s*(?(code)|(?:[A-Z]{3})?)\s*"
+)
+_NUMBER_RE = re.compile(r"\s*-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?\s*")
+_EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+_RANGE_RE = re.compile(r"\s*(?P<low>[^,]*?)\s*(?:\.\.|,)\s*(?P<high>[^,]*?)\s*")
+
+
+class RuleError(ValueError):
+    """A field or validation rule in a document type can't be compiled"""
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value):
+    """Parse a date in any accepted format; None if it isn't one"""
+    value = value.strip()
+    if _ISO_DATE_RE.fullmatch(value):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            return None
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+@lru_cache(maxsize=4096)
+def parse_currency(value):
+    """Parse an amount such as "$1,200.50", "EUR 99" or "1200"; None if it isn't one"""
+    match = _CURRENCY_RE.fullmatch(value)
+    if match is None:
+        return None
+    amount = Decimal(match.group("amount").replace(",", "") + (match.group("cents") or ""))
+    return -amount if match.group("sign") else amount
+
+
+def parse_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return Decimal(str(value))
+    if isinstance(value, str) and _NUMBER_RE.fullmatch(value):
+        try:
+            return Decimal(value.strip())
+        except InvalidOperation:
+            return None
+    return None
+
+
+def _as_text(value):
+    return value if isinstance(value, str) else str(value)
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+# Field type -> (parser returning a comparable value or None, default message)
+_TYPE_PARSERS = {
+    "date": (lambda v: parse_date(_as_text(v)), "{label} must be a valid date"),
+    "currency": (lambda v: parse_number(v) if not isinstance(v, str) else parse_currency(v), "{label} must be a currency amount"),
+    "number": (parse_number, "{label} must be a number"),
+    "email": (lambda v: v if isinstance(v, str) and _EMAIL_RE.fullmatch(v.strip()) else None, "{label} must be an email address"),
+}
+
+
+def _bound(text, parse, rule):
+    if not text:
+        return None
+    value = parse(text)
+    if value is None:
+        raise RuleError(f"Rule '{rule.get('id')}': invalid range bound '{text}'")
+    return value
+
+
+_CUSTOM_CHECKS = {
+    "not-future": lambda v: not isinstance(v, date) or v <= date.today(),
+    "not-past": lambda v: not isinstance(v, date) or v >= date.today(),
+    "positive": lambda v: not isinstance(v, Decimal) or v > 0,
+    "non-negative": lambda v: not isinstance(v, Decimal) or v >= 0,
+}
+
+
+def _compile_pattern(pattern, where):
+    if not isinstance(pattern, str):
+        raise RuleError(f"Pattern for '{where}' must be a string")
+    try:
+        regex = re.compile(pattern)
+    except re.error as e:
+        raise RuleError(f"Invalid pattern for '{where}': {e}")
+    return lambda value, parsed: regex.fullmatch(_as_text(value)) is not None
+
+
+class _FieldSpec:
+    """Checks for one field while a type is being compiled"""
+
+    __slots__ = ("label", "type", "required", "parser", "checks")
+
+    def __init__(self, field):
+        self.label = field.get("label") or field.get("name") or field["id"]
+        self.type = field.get("type")
+        self.required = f"{self.label} is required" if field.get("required") else None
+        # (parse(value) -> comparable value or None, message when it is None)
+        self.parser = None
+        if self.type in _TYPE_PARSERS:
+            parse, message = _TYPE_PARSERS[self.type]
+            self.parser = (parse, message.format(label=self.label))
+        # (check(value, parsed) -> bool, message when it is False)
+        self.checks = []
+        if field.get("pattern"):
+            self.checks.append((_compile_pattern(field["pattern"], field["id"]), f"{self.label} has an invalid format"))
+
+    def add_rule(self, rule):
+        kind = rule["type"]
+        text = rule.get("rule") or ""
+        if not isinstance(text, str):
+            raise RuleError(f"Rule '{rule.get('id')}': 'rule' must be a string")
+        message = rule.get("message")
+        if kind == "required":
+            self.required = message or f"{self.label} is required"
+        elif kind == "pattern":
+            self.checks.append((_compile_pattern(text, rule.get("id")), message or f"{self.label} has an invalid format"))
+        elif kind == "range":
+            self.checks.append((self._range(text, rule), message or f"{self.label} is out of range ({text})"))
+        elif kind == "custom":
+            check = _CUSTOM_CHECKS.get(text.strip())
+            if check is None:
+                raise RuleError(f"Unknown custom rule '{text}' (expected one of {', '.join(_CUSTOM_CHECKS)})")
+            self.checks.append(((lambda value, parsed: parsed is None or check(parsed)), message or f"{self.label} failed check '{text}'"))
+        else:
+            raise RuleError(f"Unknown validation rule type '{kind}'")
+
+    def _range(self, text, rule):
+        match = _RANGE_RE.fullmatch(text)
+        if match is None:
+            raise RuleError(f"Rule '{rule.get('id')}': range must look like 'min..max' or 'min,max'")
+        if self.parser is not None and self.type != "email":
+            # Dates, amounts and numbers are compared by value...
+            parse = self.parser[0]
+            low = _bound(match.group("low"), parse, rule)
+            high = _bound(match.group("high"), parse, rule)
+            return lambda value, parsed: (low is None or parsed >= low) and (high is None or parsed <= high)
+        # ...anything else by length
+        low = _bound(match.group("low"), parse_number, rule)
+        high = _bound(match.group("high"), parse_number, rule)
+        return lambda value, parsed: (low is None or len(_as_text(value)) >= low) and (high is None or len(_as_text(value)) <= high)
+
+
+class Validator:
+    """Compiled checks for one document type
+
+    Calling it with an extractedData dict returns the list of error
+    messages (empty when the data is valid). Every regex, range bound and
+    format is resolved at compile time, so a call is one pass over
+    precomputed checks; raises RuleError at compile time for bad rules.
+    """
+
+    __slots__ = ("type_id", "_fields")
+
+    def __init__(self, document_type):
+        self.type_id = document_type.get("id")
+        template = document_type.get("extractionTemplate") or {}
+        specs = {field["id"]: _FieldSpec(field) for field in template.get("fields") or []}
+        for rule in document_type.get("validationRules") or []:
+            if not isinstance(rule, dict) or not isinstance(rule.get("fieldId"), str) or not isinstance(rule.get("type"), str):
+                raise RuleError("Every validation rule needs a 'fieldId' and a 'type'")
+            spec = specs.get(rule["fieldId"])
+            if spec is None:
+                raise RuleError(f"Rule '{rule.get('id')}' refers to unknown field '{rule['fieldId']}'")
+            spec.add_rule(rule)
+        self._fields = tuple(
+            (field_id, spec.required, spec.parser, tuple(spec.checks)) for field_id, spec in specs.items()
+        )
+
+    def __call__(self, data):
+        errors = []
+        # Anything but an object has none of the fields
+        data = data if isinstance(data, dict) else {}
+        for field_id, required, parser, checks in self._fields:
+            value = data.get(field_id)
+            if _blank(value):
+                if required:
+                    errors.append(required)
+                continue
+            parsed = None
+            if parser is not None:
+                parsed = parser[0](value)
+                if parsed is None:
+                    errors.append(parser[1])
+                    continue
+            for check, message in checks:
+                if not check(value, parsed):
+                    errors.append(message)
+        return errors
+
+
+class ValidatorRegistry:
+    """Compiled Validators by document type id
+
+    A type is compiled the first time it is used and again only when its
+    definition changes: update() is hooked to DocumentTypeCache.put(), and
+    validator_for() also recompiles if handed a different definition object
+    than the one its validator was built from.
+    """
+
+    def __init__(self):
+        self._validators = {}
+        self._lock = threading.Lock()
+
+    def update(self, document_type):
+        validator = Validator(document_type)
+        with self._lock:
+            self._validators[document_type["id"]] = (document_type, validator)
+        return validator
+
+    def validator_for(self, document_type):
+        entry = self._validators.get(document_type["id"])
+        if entry is not None and entry[0] is document_type:
+            return entry[1]
+        return self.update(document_type)
+
+    def validate(self, document_type, data):
+        return self.validator_for(document_type)(data)
+
+    def validate_many(self, items):
+        """[(document type, extractedData)] -> [errors], compiling each type at most once"""
+        return [self.validator_for(document_type)(data) for document_type, data in items]
+
+
+validators = ValidatorRegistry()
+
+
+def check_document_type(document_type):
+    """Return the compile error for a document type definition, or None"""
+    try:
+        Validator(document_type)
+    except RuleError as e:
+        return str(e)
+    return None